@@ -0,0 +1,130 @@
+"""
+Compare event loops on the standard poll/postback workload: sessions polling
+the local stand-in with no delay, selecting (and failing) whenever a seat is
+released, for a fixed wall time. Each loop runs in a fresh interpreter, as
+the loop policy is process-wide. uvloop is skipped when it is not installed.
+
+    python -m benchmarks.loop --sessions 8 --seconds 10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import subprocess
+import sys
+import time
+
+from bot import FcuCourseMaster, TargetCourse, loop, search
+
+from .standin import StandIn
+
+LOOPS = ("asyncio", "uvloop")
+
+
+async def workload(args: argparse.Namespace):
+    standin = StandIn(
+        StandIn.generate_courses(args.targets),
+        release_rate=args.release_rate,
+        seed=0,
+    )
+    await standin.start()
+
+    bots = [
+        FcuCourseMaster(
+            username=f"D{1000000 + i:07d}",
+            password="stand-in-password",
+            target_courses=[
+                TargetCourse(course_id, course.credit)
+                for course_id, course in standin.courses.items()
+            ],
+            **standin.bot_options(delay=0),
+        )
+        for i in range(args.sessions)
+    ]
+    monitor = loop.LoopLagMonitor(interval=0.01).start()
+    tasks = [asyncio.create_task(bot.start()) for bot in bots]
+
+    # measure after every session has logged in
+    while standin.requests["login"] < args.sessions:
+        await asyncio.sleep(0.05)
+    monitor.samples.clear()
+    requests = dict(standin.requests)
+    cpu = time.process_time()
+    started = time.perf_counter()
+
+    await asyncio.sleep(args.seconds)
+
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+    requests = {k: v - requests.get(k, 0) for k, v in standin.requests.items()}
+    monitor.stop()
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for bot in bots:
+        await bot.close()
+    await search.close()
+    await standin.close()
+
+    return {
+        "polls_per_second": requests.get("quota", 0) / elapsed,
+        "postbacks_per_second": (requests.get("postback", 0) + requests.get("select", 0)) / elapsed,
+        "cpu_per_poll_us": cpu / max(requests.get("quota", 0), 1) * 1e6,
+        "lag_ms": [lag * 1000 for lag in monitor.percentiles(50, 99, 100)],
+    }
+
+
+def child(args: argparse.Namespace):
+    result = loop.run(workload(args), loop=args.loop, monitor=False)
+    result["loop"] = args.loop
+    result["max_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--sessions", type=int, default=8)
+    arg_parser.add_argument("--targets", type=int, default=3, help="target courses per session")
+    arg_parser.add_argument("--seconds", type=float, default=10)
+    arg_parser.add_argument("--release-rate", type=float, default=0.05)
+    arg_parser.add_argument("--loop", choices=LOOPS, help="run one loop in this process")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.loop:
+        child(args)
+        return
+
+    results = []
+    for name in LOOPS:
+        if name == "uvloop" and loop.uvloop is None:
+            print("uvloop is not installed, skipped. `pip install uvloop` to compare.")
+            continue
+
+        argv = [sys.executable, "-m", "benchmarks.loop", "--loop", name]
+        for option in ("sessions", "targets", "seconds", "release_rate"):
+            argv += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+
+        output = subprocess.run(argv, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.sessions} sessions x {args.targets} targets, {args.seconds:.0f}s")
+    print(
+        f"{'loop':<8} {'polls/s':>9} {'posts/s':>8} {'cpu/poll':>10}"
+        f" {'lag p50':>8} {'p99':>7} {'max':>7} {'rss':>8}"
+    )
+    for r in results:
+        p50, p99, worst = r["lag_ms"]
+        print(
+            f"{r['loop']:<8} {r['polls_per_second']:9.0f} {r['postbacks_per_second']:8.1f}"
+            f" {r['cpu_per_poll_us']:8.0f}us {p50:6.2f}ms {p99:5.2f}ms {worst:5.1f}ms"
+            f" {r['max_rss_mib']:5.0f}MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Seat-release simulator: compare polling strategies offline.
+
+Runs the strategies of `bot.polling` through the same due/observe/delay cycle
+the bots use, against synthesized seat releases or a quota history log
+(`bot.history`), in virtual time, so a whole registration window takes seconds.
+Reports how long each strategy takes to detect a free seat, how many openings
+it misses because the seat was taken again first, and how many requests it
+sends upstream.
+
+    python -m benchmarks.polling --courses 20 --budget 2
+    python -m benchmarks.polling --replay quota.log
+"""
+
+import argparse
+import bisect
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from bot import history
+from bot.polling import Adaptive, Batched, FixedDelay, PollingStrategy
+from bot.quota import QuotaTable
+
+QUOTA = 60
+
+
+class Course:
+    def __init__(self, times: List[float], quota: List[int], selected: List[int]):
+        """
+        Quota of a course over time, a step function.
+
+        Args:
+            times (List[float]): Timestamps of each step, sorted.
+            quota (List[int]): Quota from each step on.
+            selected (List[int]): Selected count from each step on.
+        """
+        self.times = times
+        self.quota = quota
+        self.selected = selected
+
+    def at(self, t: float):
+        """
+        Returns:
+            Tuple[int, int]: Quota and selected count at t, full before the first step.
+        """
+        i = bisect.bisect_right(self.times, t) - 1
+        if i < 0:
+            return QUOTA, QUOTA
+        return self.quota[i], self.selected[i]
+
+    def openings(self):
+        """
+        Returns:
+            List[Tuple[float, float]]: (opened, closed) of each period with a free seat.
+        """
+        periods = []
+        opened = None
+        for t, quota, selected in zip(self.times, self.quota, self.selected):
+            if selected < quota and opened is None:
+                opened = t
+            elif selected >= quota and opened is not None:
+                periods.append((opened, t))
+                opened = None
+        if opened is not None:
+            periods.append((opened, float("inf")))
+        return periods
+
+
+def synthesize(count: int, hours: float, bursts: float, spread: float, hold: float, seed: int = 0):
+    """
+    Seat releases come in bursts, e.g. after a drop deadline, with a few seats each.
+    Every released seat is taken again after an exponential time.
+
+    Args:
+        count (int): Number of courses.
+        hours (float): Window length.
+        bursts (float): Bursts per course per hour.
+        spread (float): Mean seconds between releases in a burst.
+        hold (float): Mean seconds until a released seat is taken.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        Dict[str, Course]: Courses by ID.
+        float: Window start.
+        float: Window end.
+    """
+    rng = random.Random(seed)
+    window = hours * 3600
+    courses = {}
+
+    for i in range(count):
+        steps = []  # (time, +1 released / -1 taken)
+        t = rng.expovariate(bursts / 3600)
+        while t < window:
+            released = t
+            while True:
+                steps.append((released, 1))
+                steps.append((released + rng.expovariate(1 / hold), -1))
+                if rng.random() < 0.5:
+                    break
+                released += rng.expovariate(1 / spread)
+            t += rng.expovariate(bursts / 3600)
+
+        steps.sort()
+        free = 0
+        times, selected = [], []
+        for t, change in steps:
+            free += change
+            times.append(t)
+            selected.append(QUOTA - free)
+        courses[str(1000 + i)] = Course(times, [QUOTA] * len(times), selected)
+
+    return courses, 0.0, window
+
+
+def replay(path: str):
+    """
+    Args:
+        path (str): Quota history log, see `bot.history`.
+
+    Returns:
+        Dict[str, Course]: Courses by ID.
+        float: Window start.
+        float: Window end.
+    """
+    records, course_ids = history.read(path)
+    records = records[np.lexsort((records["timestamp"], records["course"]))]
+
+    courses = {}
+    for i in np.unique(records["course"]):
+        r = records[records["course"] == i]
+        courses[course_ids[i]] = Course(
+            r["timestamp"].tolist(), r["quota"].tolist(), r["selected"].tolist()
+        )
+
+    return courses, float(records["timestamp"].min()), float(records["timestamp"].max())
+
+
+class Result(NamedTuple):
+    name: str
+    requests: int
+    duration: float
+    latencies: np.ndarray
+    missed: int
+
+
+def simulate(
+    name: str,
+    strategy: PollingStrategy,
+    courses: Dict[str, Course],
+    start: float,
+    end: float,
+    rtt: float,
+):
+    """
+    Run a strategy through a window. Requests are sequential and take `rtt` each,
+    like the poll loop of the bots. Selected courses are kept, only detection is measured.
+
+    Returns:
+        Result: Result.
+    """
+    course_ids = list(courses)
+    table = QuotaTable()
+    seen: Dict[str, List[float]] = defaultdict(list)
+    requests = 0
+    now = start
+
+    while now < end:
+        if strategy.batch is not None:
+            requests += 1
+            now += rtt
+            quota, selected = zip(*(courses[c].at(now) for c in course_ids))
+            table.update_many(course_ids, quota, selected, now)
+            strategy.observe_batch(course_ids, now)
+            for course_id in course_ids:
+                seen[course_id].append(now)
+
+        for course_id in strategy.due(course_ids, table, now):
+            requests += 1
+            now += rtt
+            quota, selected = courses[course_id].at(now)
+            table.update(course_id, quota, selected, now)
+            strategy.observe(course_id, quota, selected, now)
+            seen[course_id].append(now)
+
+        now += strategy.delay(now)
+
+    latencies = []
+    missed = 0
+    for course_id, course in courses.items():
+        polls = seen[course_id]
+        for opened, closed in course.openings():
+            if opened < start or opened >= end:
+                continue
+            i = bisect.bisect_left(polls, opened)
+            if i < len(polls) and polls[i] < closed:
+                latencies.append(polls[i] - opened)
+            else:
+                missed += 1
+
+    return Result(name, requests, end - start, np.array(latencies), missed)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--replay", help="quota history log to replay instead of synthesized releases")
+    arg_parser.add_argument("--courses", type=int, default=20)
+    arg_parser.add_argument("--hours", type=float, default=2)
+    arg_parser.add_argument("--bursts", type=float, default=2, help="release bursts per course per hour")
+    arg_parser.add_argument("--spread", type=float, default=20, help="mean seconds between releases in a burst")
+    arg_parser.add_argument("--hold", type=float, default=30, help="mean seconds until a released seat is taken")
+    arg_parser.add_argument("--budget", type=float, default=2, help="upstream requests per second")
+    arg_parser.add_argument("--rtt", type=float, default=0.05, help="seconds per request")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    if args.replay:
+        courses, start, end = replay(args.replay)
+    else:
+        courses, start, end = synthesize(
+            args.courses, args.hours, args.bursts, args.spread, args.hold, args.seed
+        )
+
+    # every strategy gets the same request budget
+    n = len(courses)
+    interval = n / args.budget  # seconds between polls of one course at the fixed delay
+    strategies = {
+        "fixed": FixedDelay(max(interval - n * args.rtt, 0)),
+        "adaptive": Adaptive(min_delay=interval / 8, max_delay=interval * 1.5, rate=args.budget),
+        "batched": Batched(max(1 / args.budget - args.rtt, 0), {}),
+    }
+
+    print(f"{n} courses, {(end - start) / 3600:.2f}h, budget {args.budget} req/s, rtt {args.rtt * 1000:.0f}ms")
+    print(
+        f"{'strategy':>10} {'requests':>9} {'req/s':>7} {'openings':>9} {'missed':>7}"
+        f" {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+    )
+
+    for name, strategy in strategies.items():
+        started = time.perf_counter()
+        r = simulate(name, strategy, courses, start, end, args.rtt)
+        p50, p90, p99, p100 = (
+            np.percentile(r.latencies, [50, 90, 99, 100]) if len(r.latencies) else [float("nan")] * 4
+        )
+        print(
+            f"{name:>10} {r.requests:>9} {r.requests / r.duration:>7.2f}"
+            f" {len(r.latencies) + r.missed:>9} {r.missed:>7}"
+            f" {p50:>7.2f}s {p90:>7.2f}s {p99:>7.2f}s {p100:>7.2f}s"
+            f"  ({time.perf_counter() - started:.1f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
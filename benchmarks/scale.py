@@ -0,0 +1,295 @@
+"""
+Capacity benchmark: ramp the number of FcuCourseMaster sessions in one
+process against the local stand-in and record, at each step, event loop lag,
+CPU and memory per session, polls per second and the latency from quota
+detection to the select response.
+
+Each step runs in a fresh interpreter, so memory is not carried over. The
+stand-in runs on a thread of this process, so its CPU is not counted against
+the sessions. Its own loop lag is reported too: if it grows, the stand-in is
+the bottleneck, not the bot. The curve can be saved and compared with one of
+an earlier release.
+
+    python -m benchmarks.scale --sessions 1,4,16,64 --out scale.json
+    python -m benchmarks.scale --compare scale.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+from typing import List
+
+import bot
+from bot import FcuCourseMaster, TargetCourse, loop, metrics, search
+from bot.resources import Resources
+from bot.search import SearchOption
+
+from .soak import MIB, get_rss
+from .standin import StandIn
+
+
+class StandInThread:
+    def __init__(self, release_rate: float):
+        """
+        Serve a stand-in on its own event loop in a background thread.
+
+        Args:
+            release_rate (float): See `StandIn`.
+        """
+        self.release_rate = release_rate
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.standin: StandIn = None
+        self.monitor: loop.LoopLagMonitor = None
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def start(self, courses: int):
+        async def start():
+            self.standin = StandIn(
+                StandIn.generate_courses(courses), release_rate=self.release_rate, seed=0
+            )
+            await self.standin.start()
+            self.monitor = loop.LoopLagMonitor(interval=0.01).start()
+
+        self.call(start())
+        return self.standin.url, self.standin.search_url
+
+    def stop(self):
+        async def stop():
+            self.monitor.stop()
+            await self.standin.close()
+            return self.monitor.percentiles(99)[0]
+
+        return self.call(stop())
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+async def step(args: argparse.Namespace):
+    # load what every session needs once, so it is not counted per session
+    import bs4, cv2, numpy  # noqa: F401
+
+    metrics.enable()
+    baseline = get_rss()
+    resources = Resources() if args.shared else None
+
+    latencies: List[float] = []
+    bots = []
+    for i in range(args.step):
+        b = FcuCourseMaster(
+            username=f"D{1000000 + i:07d}",
+            password="stand-in-password",
+            target_courses=[
+                TargetCourse(str(1000 + i * args.targets + j), 2) for j in range(args.targets)
+            ],
+            course_url=args.url,
+            search_option=SearchOption(url=args.search_url, delay=args.delay),
+            resources=resources,
+        )
+
+        # quota detection to the select response, whatever the result
+        async def select_course(course_id, select_course=b.select_course):
+            started = time.perf_counter()
+            try:
+                return await select_course(course_id)
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+        b.select_course = select_course
+        bots.append(b)
+
+    monitor = loop.LoopLagMonitor(interval=0.01).start()
+    login_started = time.perf_counter()
+    tasks = [asyncio.create_task(b.start()) for b in bots]
+    while any(b.heartbeat is None for b in bots):
+        await asyncio.sleep(0.05)
+    login_seconds = time.perf_counter() - login_started
+
+    await asyncio.sleep(args.warmup)
+    monitor.samples.clear()
+    latencies.clear()
+    polls = metrics.POLLS_TOTAL.values.get((), 0)
+    cpu = time.process_time()
+    started = time.perf_counter()
+
+    await asyncio.sleep(args.seconds)
+
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+    polls = metrics.POLLS_TOTAL.values.get((), 0) - polls
+    rss = get_rss()
+    monitor.stop()
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for b in bots:
+        await b.close()
+    if resources:
+        await resources.close()
+    else:
+        await search.close()
+
+    latencies.sort()
+
+    def select_ms(p: float):
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000
+
+    lag_p50, lag_p99, lag_max = monitor.percentiles(50, 99, 100)
+
+    return {
+        "sessions": args.step,
+        "targets": args.step * args.targets,
+        "login_seconds": login_seconds,
+        "polls_per_second": polls / elapsed,
+        "cpu_per_session": cpu / elapsed / args.step,  # fraction of a core
+        "rss_per_session_mib": (rss - baseline) / args.step / MIB,
+        "lag_p50_ms": lag_p50 * 1000,
+        "lag_p99_ms": lag_p99 * 1000,
+        "lag_max_ms": lag_max * 1000,
+        "selects": len(latencies),
+        "select_p50_ms": select_ms(50),
+        "select_p99_ms": select_ms(99),
+    }
+
+
+def run_step(args: argparse.Namespace, standin: StandInThread, sessions: int):
+    url, search_url = standin.start(sessions * args.targets)
+
+    argv = [
+        sys.executable, "-m", "benchmarks.scale",
+        "--step", str(sessions), "--url", url, "--search-url", search_url,
+    ]  # fmt: skip
+    for option in ("targets", "seconds", "warmup", "delay"):
+        argv += [f"--{option}", str(getattr(args, option))]
+    if args.shared:
+        argv.append("--shared")
+
+    try:
+        output = subprocess.run(argv, capture_output=True, text=True, check=True).stdout
+    finally:
+        standin_lag = standin.stop()
+
+    result = json.loads(output.strip().splitlines()[-1])
+    result["standin_lag_p99_ms"] = standin_lag * 1000
+    return result
+
+
+def format_ms(value):
+    return f"{value:7.1f}" if value is not None else "      -"
+
+
+def print_curve(curve: dict, max_lag: float):
+    print(
+        f"bot {curve['version']}, {curve['targets_per_session']} targets per session,"
+        f" delay {curve['delay']}s, {curve['seconds']:.0f}s per step"
+        f"{', shared connector' if curve.get('shared') else ''}"
+    )
+    print(
+        f"{'sessions':>8} {'polls/s':>8} {'cpu/sess':>9} {'rss/sess':>9} {'login':>7}"
+        f" {'lag p50':>8} {'p99':>7} {'max':>7} {'select p50':>11} {'p99':>7} {'stand-in p99':>13}"
+    )
+    for r in curve["steps"]:
+        print(
+            f"{r['sessions']:8d} {r['polls_per_second']:8.0f} {r['cpu_per_session'] * 100:8.2f}%"
+            f" {r['rss_per_session_mib']:6.2f}MiB {r['login_seconds']:6.1f}s"
+            f" {format_ms(r['lag_p50_ms'])}ms{format_ms(r['lag_p99_ms'])}{format_ms(r['lag_max_ms'])}"
+            f"    {format_ms(r['select_p50_ms'])}{format_ms(r['select_p99_ms'])}"
+            f"       {format_ms(r['standin_lag_p99_ms'])}"
+        )
+
+    within = list(itertools.takewhile(lambda r: r["lag_p99_ms"] <= max_lag, curve["steps"]))
+    if within:
+        r = within[-1]
+        print(
+            f"capacity: {r['sessions']} sessions with loop lag p99 <= {max_lag:g}ms,"
+            f" CPU bound at about {1 / max(r['cpu_per_session'], 1e-9):.0f} sessions per core"
+        )
+    else:
+        print(f"capacity: loop lag p99 is over {max_lag:g}ms at every step")
+
+
+def print_comparison(previous: dict, current: dict):
+    print(f"\nbot {previous['version']} -> {current['version']}")
+    print(f"{'sessions':>8} {'lag p99 ms':>21} {'cpu/sess %':>17} {'rss/sess MiB':>17} {'select p50 ms':>21}")
+
+    steps = {r["sessions"]: r for r in previous["steps"]}
+    for r in current["steps"]:
+        old = steps.get(r["sessions"])
+        if old is None:
+            continue
+        print(
+            f"{r['sessions']:8d}"
+            f" {format_ms(old['lag_p99_ms'])} -> {format_ms(r['lag_p99_ms'])}"
+            f"   {old['cpu_per_session'] * 100:5.2f} -> {r['cpu_per_session'] * 100:5.2f}"
+            f"   {old['rss_per_session_mib']:5.2f} -> {r['rss_per_session_mib']:5.2f}"
+            f"   {format_ms(old['select_p50_ms'])} -> {format_ms(r['select_p50_ms'])}"
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--sessions", default="1,4,16,64", help="comma separated steps")
+    arg_parser.add_argument("--targets", type=int, default=3, help="target courses per session")
+    arg_parser.add_argument("--seconds", type=float, default=10, help="measured seconds per step")
+    arg_parser.add_argument("--warmup", type=float, default=3, help="seconds after login before measuring")
+    arg_parser.add_argument("--delay", type=float, default=1, help="SearchOption.delay")
+    arg_parser.add_argument("--release-rate", type=float, default=0.05)
+    arg_parser.add_argument("--shared", action="store_true", help="share one connector, see bot.resources")
+    arg_parser.add_argument("--max-lag", type=float, default=50, help="p99 loop lag in ms still within capacity")
+    arg_parser.add_argument("--out", help="save the curve as JSON")
+    arg_parser.add_argument("--compare", help="curve JSON of an earlier run to compare with")
+    # one step, run by the parent in a fresh interpreter
+    arg_parser.add_argument("--step", type=int, help=argparse.SUPPRESS)
+    arg_parser.add_argument("--url", help=argparse.SUPPRESS)
+    arg_parser.add_argument("--search-url", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.step:
+        print(json.dumps(loop.run(step(args), loop="asyncio", monitor=False)))
+        return
+
+    standin = StandInThread(args.release_rate)
+    curve = {
+        "version": bot.__version__,
+        "targets_per_session": args.targets,
+        "delay": args.delay,
+        "shared": args.shared,
+        "seconds": args.seconds,
+        "steps": [],
+    }
+    try:
+        for sessions in map(int, args.sessions.split(",")):
+            curve["steps"].append(run_step(args, standin, sessions))
+            print(f"{sessions} sessions done", file=sys.stderr, flush=True)
+    finally:
+        standin.close()
+
+    print_curve(curve, args.max_lag)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(curve, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), curve)
+
+
+if __name__ == "__main__":
+    main()
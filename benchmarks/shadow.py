@@ -0,0 +1,83 @@
+"""
+Latency budget of a select: run sessions in shadow mode against the local
+stand-in and report where the time between a seat opening and the add
+request goes, per stage (see bot.shadow). Nothing is selected, the final add
+postback is built but never sent.
+
+    python -m benchmarks.shadow --sessions 4 --seconds 20 --armed
+"""
+
+import argparse
+import asyncio
+import logging
+
+from bot import FcuCourseMaster, TargetCourse, loop, search
+from bot.shadow import Recorder
+
+from .standin import StandIn
+
+
+async def run(args: argparse.Namespace):
+    standin = StandIn(
+        StandIn.generate_courses(args.targets),
+        release_rate=args.release_rate,
+        seed=0,
+    )
+    await standin.start()
+
+    recorder = Recorder()
+    bots = [
+        FcuCourseMaster(
+            username=f"D{1000000 + i:07d}",
+            password="stand-in-password",
+            target_courses=[
+                TargetCourse(course_id, course.credit)
+                for course_id, course in standin.courses.items()
+            ],
+            parse_executor=args.parse_executor,
+            armed=args.armed,
+            shadow=recorder,
+            **standin.bot_options(delay=args.delay),
+        )
+        for i in range(args.sessions)
+    ]
+    monitor = loop.LoopLagMonitor(interval=0.01).start()
+    tasks = [asyncio.create_task(bot.start()) for bot in bots]
+
+    await asyncio.sleep(args.seconds)
+
+    monitor.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for bot in bots:
+        await bot.close()
+    await search.close()
+    await standin.close()
+
+    print(f"{args.sessions} sessions x {args.targets} targets, {args.seconds:.0f}s, armed={args.armed}")
+    print(f"requests {dict(standin.requests)}")
+    print(recorder.format_report())
+    p50, p99 = monitor.percentiles(50, 99)
+    print(f"loop lag p50 {p50 * 1000:.3f}ms p99 {p99 * 1000:.3f}ms")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--sessions", type=int, default=4)
+    arg_parser.add_argument("--targets", type=int, default=3, help="target courses per session")
+    arg_parser.add_argument("--seconds", type=float, default=20)
+    arg_parser.add_argument("--delay", type=float, default=0.05, help="SearchOption.delay")
+    arg_parser.add_argument("--release-rate", type=float, default=0.05)
+    arg_parser.add_argument("--armed", action="store_true")
+    arg_parser.add_argument("--parse-executor", choices=["thread", "process"])
+    arg_parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default="auto")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    loop.run(run(args), loop=args.loop, monitor=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Soak test: run FcuCourseMaster sessions against the local stand-in for a
+simulated multi-hour registration window and watch memory.
+
+Every poll cycle stands for `--interval` seconds of a real session, and every
+8 simulated minutes the session heartbeat is aged so the bot sends its
+keep-alive postback. RSS and tracemalloc are sampled along the way, and the
+run fails if RSS or traced memory per session grows more than `--threshold`
+MiB after warm-up. Only two tracemalloc snapshots are taken, at warm-up and
+at the end, so the snapshots themselves do not show up as growth.
+
+    python -m benchmarks.soak --sessions 4 --hours 3
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+from typing import List, NamedTuple
+
+from bot import FcuCourseMaster, TargetCourse, search
+
+from .standin import StandIn
+
+MIB = 1024 * 1024
+
+
+def get_rss():
+    """
+    Returns:
+        int: Current resident set size in bytes, or the peak if current is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Sample(NamedTuple):
+    simulated_hours: float
+    rss: int
+    traced: int
+
+
+class Soak:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.standin = StandIn(
+            StandIn.generate_courses(args.targets),
+            release_rate=args.release_rate,
+            error_rate=args.error_rate,
+            seed=0,
+        )
+        self.bots: List[FcuCourseMaster] = []
+        self.samples: List[Sample] = []
+        self.warm_index = max(1, int(args.samples * args.warmup))
+        self.warm_snapshot: tracemalloc.Snapshot = None
+        self.last_snapshot: tracemalloc.Snapshot = None  # after the last RSS sample
+
+    def sample(self, simulated_hours: float):
+        traced = tracemalloc.get_traced_memory()[0] if self.args.tracemalloc else 0
+
+        # the warm-up snapshot is taken before reading RSS and kept, so it
+        # adds the same to every RSS sample from then on
+        if self.args.tracemalloc and len(self.samples) == self.warm_index:
+            self.warm_snapshot = tracemalloc.take_snapshot()
+
+        rss = get_rss()
+        self.samples.append(Sample(simulated_hours, rss, traced))
+
+        print(
+            f"{simulated_hours:6.2f}h  rss {rss / MIB:8.1f} MiB"
+            f"  traced {traced / MIB:8.1f} MiB",
+            flush=True,
+        )
+
+    async def run(self):
+        args = self.args
+        await self.standin.start()
+
+        if args.tracemalloc:
+            tracemalloc.start()
+
+        self.bots = [
+            FcuCourseMaster(
+                username=f"D{1000000 + i:07d}",
+                password="stand-in-password",
+                target_courses=[
+                    TargetCourse(course_id, course.credit)
+                    for course_id, course in self.standin.courses.items()
+                ],
+                parse_executor=args.parse_executor,
+                **self.standin.bot_options(delay=0),
+            )
+            for i in range(args.sessions)
+        ]
+        tasks = [asyncio.create_task(bot.start()) for bot in self.bots]
+
+        polls_per_cycle = args.sessions * args.targets
+        cycles_total = args.hours * 3600 / args.interval
+        keepalive_every = 8 * 60 / args.interval
+        sample_every = cycles_total / args.samples
+        next_keepalive = keepalive_every
+        next_sample = 0
+        started = time.perf_counter()
+
+        while True:
+            await asyncio.sleep(0.05)
+            cycles = self.standin.requests["quota"] / polls_per_cycle
+
+            if cycles >= next_keepalive:
+                next_keepalive += keepalive_every
+                for bot in self.bots:
+                    if bot.heartbeat is not None:
+                        bot.heartbeat -= timedelta(minutes=8, seconds=30)
+
+            if cycles >= next_sample:
+                next_sample += sample_every
+                self.sample(cycles * args.interval / 3600)
+
+            if cycles >= cycles_total:
+                if args.tracemalloc:
+                    self.last_snapshot = tracemalloc.take_snapshot()
+                break
+
+            for task in tasks:
+                if task.done():
+                    task.result()
+                    raise RuntimeError("A session stopped before the soak ended.")
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for bot in self.bots:
+            await bot.close()
+        await search.close()
+        await self.standin.close()
+
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float):
+        """
+        Print the memory growth after warm-up.
+
+        Returns:
+            bool: True if memory per session stays under the threshold.
+        """
+        args = self.args
+        warm_index = min(self.warm_index, len(self.samples) - 1)
+        warm = self.samples[warm_index]
+        last = self.samples[-1]
+
+        rss_growth = (last.rss - warm.rss) / args.sessions / MIB
+        traced_growth = (last.traced - warm.traced) / args.sessions / MIB
+
+        print()
+        print(f"elapsed {elapsed:.1f}s, requests {dict(self.standin.requests)}")
+        print(
+            f"growth per session after {warm.simulated_hours:.2f}h:"
+            f" rss {rss_growth:+.3f} MiB, traced {traced_growth:+.3f} MiB"
+        )
+
+        if self.warm_snapshot is not None and self.last_snapshot is not None:
+            print("top allocators since warm-up:")
+            for stat in self.last_snapshot.compare_to(self.warm_snapshot, "lineno")[:10]:
+                print(f"  {stat}")
+
+        # RSS also catches leaks outside the Python heap, e.g. in C extensions
+        failed = False
+        for name, growth in (("rss", rss_growth), ("traced", traced_growth)):
+            if growth > args.threshold:
+                print(f"FAIL: {name} {growth:.3f} MiB per session > {args.threshold} MiB")
+                failed = True
+
+        if failed:
+            return False
+
+        print("OK")
+        return True
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--sessions", type=int, default=4)
+    arg_parser.add_argument("--targets", type=int, default=3, help="target courses per session")
+    arg_parser.add_argument("--hours", type=float, default=3, help="simulated hours")
+    arg_parser.add_argument("--interval", type=float, default=1, help="simulated seconds per poll cycle")
+    arg_parser.add_argument("--samples", type=int, default=20)
+    arg_parser.add_argument("--warmup", type=float, default=0.1, help="fraction of samples to skip")
+    arg_parser.add_argument("--threshold", type=float, default=1.0, help="MiB growth per session")
+    arg_parser.add_argument("--release-rate", type=float, default=0.01)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--parse-executor", choices=["thread", "process"])
+    arg_parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    soak = Soak(args)
+    elapsed = asyncio.get_event_loop().run_until_complete(soak.run())
+    sys.exit(0 if soak.report(elapsed) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+Local stand-in for course.fcu.edu.tw and the coursesearch API.
+
+It serves just enough of both sites for `FcuCourseMaster` to log in, keep the
+session alive, poll quotas and select courses, so soak tests and benchmarks
+can run offline:
+
+    standin = StandIn(StandIn.generate_courses(20))
+    await standin.start()
+    bot = FcuCourseMaster(..., **standin.bot_options())
+"""
+
+import base64
+import random
+import re
+import secrets
+import struct
+import zlib
+from collections import Counter
+from html import escape
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from bot import timetable
+from bot.search import SearchOption
+from bot.verify_code_parser import DIGITS
+
+PERIODS = 14  # rows of the rendered timetable
+
+
+class StandInCourse:
+    def __init__(
+        self,
+        course_id: str,
+        name: str,
+        credit: int,
+        period: str,
+        quota: int = 50,
+        selected: int = 50,
+    ):
+        """
+        A course served by the stand-in.
+
+        Args:
+            course_id (str): Course ID (scr_selcode).
+            name (str): Course name.
+            credit (int): Credit of the course.
+            period (str): Period and room, e.g. "(一)03-04 資電234".
+            quota (int, optional): Quota. Defaults to 50.
+            selected (int, optional): Selected count. Defaults to 50 (full).
+        """
+        self.id = course_id
+        self.name = name
+        self.credit = credit
+        self.period = period
+        self.quota = quota
+        self.selected = selected
+        self.slots = timetable.from_period(period)
+
+    def as_item(self):
+        return {
+            "scr_selcode": self.id,
+            "sub_name": self.name,
+            "scr_credit": self.credit,
+            "scj_scr_mso": "選修",
+            "scr_period": f"{self.period} 王小明",
+            "scr_precnt": self.quota,
+            "scr_acptcnt": self.selected,
+            "cls_id": "CE01",
+            "sub_id": self.id,
+            "scr_dup": "001",
+        }
+
+
+class _User:
+    def __init__(self, username: str, selected: List[str], wishlist: List[str]):
+        self.username = username
+        self.selected = list(selected)
+        self.wishlist = list(wishlist)
+        self.searched: Optional[str] = None
+        self.max_credit = 25
+
+
+def verify_code_png(code: str):
+    """
+    Draw a verify code image that `parse_veify_code` can read.
+
+    Args:
+        code (str): 4 digits.
+
+    Returns:
+        bytes: PNG image.
+    """
+    width, height = 45, 22
+    pixels = [[0] * width for _ in range(height)]
+
+    for i, digit in enumerate(code):
+        template = DIGITS[int(digit)]
+        for y in range(12):
+            for x in range(8):
+                pixels[5 + y][6 + 9 * i + x] = 255 if template[y * 8 + x] else 0
+
+    raw = b"".join(b"\x00" + bytes(v for v in row for _ in range(3)) for row in pixels)
+
+    def chunk(tag: bytes, data: bytes):
+        return (
+            struct.pack(">I", len(data))
+            + tag
+            + data
+            + struct.pack(">I", zlib.crc32(tag + data))
+        )
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+class StandIn:
+    def __init__(
+        self,
+        courses: List[StandInCourse],
+        initial_selected: List[str] = (),
+        wishlist: List[str] = (),
+        release_rate: float = 0.01,
+        fill_rate: float = 0.5,
+        win_rate: float = 0.0,
+        error_rate: float = 0.0,
+        viewstate_size: int = 16384,
+        seed: int = None,
+    ):
+        """
+        Args:
+            courses (List[StandInCourse]): Courses to serve.
+            initial_selected (List[str], optional): Course IDs every new user starts with. Defaults to ().
+            wishlist (List[str], optional): Course IDs in every new user's wishlist. Defaults to ().
+            release_rate (float, optional): Chance that a full course frees a seat on each poll. Defaults to 0.01.
+            fill_rate (float, optional): Chance that someone else takes a free seat on each poll. Defaults to 0.5.
+            win_rate (float, optional): Chance that selecting a free seat succeeds. Defaults to 0.0, so soak runs never finish.
+            error_rate (float, optional): Chance that a postback asks to login again. Defaults to 0.0.
+            viewstate_size (int, optional): Bytes of random __VIEWSTATE per response. Defaults to 16384.
+            seed (int, optional): Random seed. Defaults to None.
+        """
+        self.courses: Dict[str, StandInCourse] = {c.id: c for c in courses}
+        self.initial_selected = list(initial_selected)
+        self.wishlist = list(wishlist)
+        self.release_rate = release_rate
+        self.fill_rate = fill_rate
+        self.win_rate = win_rate
+        self.error_rate = error_rate
+        self.viewstate_size = viewstate_size
+        self.random = random.Random(seed)
+
+        self.verify_code = "".join(self.random.choice("0123456789") for _ in range(4))
+        self.users: Dict[str, _User] = {}
+        self.guids: Dict[str, _User] = {}
+        self.requests = Counter()
+
+        self.url: str = None
+        self.runner: web.AppRunner = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/", self.handle_index)
+        self.app.router.add_get("/validateCode.aspx", self.handle_verify_code)
+        self.app.router.add_post("/Login.aspx", self.handle_login)
+        self.app.router.add_post("/AddWithdraw.aspx", self.handle_postback)
+        self.app.router.add_post(
+            "/Service/Search.asmx/GetType2Result", self.handle_search
+        )
+
+    @staticmethod
+    def generate_courses(count: int, seed: int = 0, start_id: int = 1000):
+        """
+        Generate full courses with random periods.
+
+        Args:
+            count (int): Number of courses.
+            seed (int, optional): Random seed. Defaults to 0.
+            start_id (int, optional): First course ID. Defaults to 1000.
+
+        Returns:
+            List[StandInCourse]: Courses.
+        """
+        rng = random.Random(seed)
+        courses = []
+        for i in range(count):
+            week = timetable.WEEKDAYS[rng.randrange(5)]
+            start = rng.randrange(1, PERIODS - 1)
+            courses.append(
+                StandInCourse(
+                    str(start_id + i),
+                    f"課程{start_id + i}",
+                    rng.choice((2, 3)),
+                    f"({week}){start:02d}-{start + 1:02d} 資電{rng.randrange(100, 999)}",
+                )
+            )
+        return courses
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Start serving.
+
+        Args:
+            host (str, optional): Host to bind. Defaults to "127.0.0.1".
+            port (int, optional): Port to bind, 0 picks a free one. Defaults to 0.
+        """
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        self.url = "http://{}:{}".format(*self.runner.addresses[0][:2])
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    @property
+    def search_url(self):
+        return f"{self.url}/Service/Search.asmx/GetType2Result"
+
+    def bot_options(self, **search_option):
+        """
+        Keyword arguments pointing `FcuCourseMaster` at this stand-in.
+
+        Args:
+            **search_option: Extra SearchOption fields, e.g. delay=0.
+
+        Returns:
+            dict: course_url and search_option.
+        """
+        return {
+            "course_url": self.url,
+            "search_option": SearchOption(url=self.search_url, **search_option),
+        }
+
+    # --- pages ---
+
+    def _state_inputs(self):
+        viewstate = base64.b64encode(
+            self.random.randbytes(self.viewstate_size)
+        ).decode()
+        return (
+            f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />'
+            '<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="7A0B5E3C" />'
+            f'<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{secrets.token_urlsafe(96)}" />'
+        )
+
+    def _render_login(self, error: str = None):
+        error_row = (
+            f'<table id="ctl00_Login1"><tr><td align="center" style="color:Red;">{escape(error)}</td></tr></table>'
+            if error
+            else '<table id="ctl00_Login1"><tr><td></td></tr></table>'
+        )
+        return web.Response(
+            text=f'<html><body><form id="aspnetForm" action="./Login.aspx">{self._state_inputs()}{error_row}</form></body></html>',
+            content_type="text/html",
+        )
+
+    def _render_service(self, guid: str, user: _User, message: str = ""):
+        prefix = "ctl00_MainContent_TabContainer1_tabSelected"
+        name_prefix = "ctl00$MainContent$TabContainer1$tabSelected"
+
+        wishlist_rows = "".join(
+            f'<tr><td class="gvAddWithdrawCellOne">{course_id}</td>'
+            f'<td class="gvAddWithdrawCellThree">{escape(self.courses[course_id].name)}</td>'
+            f'<td><input type="submit" name="{name_prefix}$gvWishList$ctl{i + 2:02d}$btnAdd" value="加選" />'
+            f'<input type="submit" name="{name_prefix}$gvWishList$ctl{i + 2:02d}$btnRemove" value="取消關注" /></td></tr>'
+            for i, course_id in enumerate(user.wishlist)
+        )
+
+        selected = [self.courses[course_id] for course_id in user.selected]
+
+        def cell(week: int, period: int):
+            slot = timetable.slot(week, period)
+            return next((c.name for c in selected if c.slots & slot), "")
+
+        timetable_rows = "".join(
+            "<tr><td>{}</td>{}</tr>".format(
+                period,
+                "".join(
+                    f"<td>{escape(cell(week, period))}</td>"
+                    for week in range(1, timetable.WEEKS + 1)
+                ),
+            )
+            for period in range(1, PERIODS + 1)
+        )
+
+        to_add = ""
+        if user.searched:
+            course = self.courses[user.searched]
+            to_add = f'<tr><td>{course.id}</td><td>{escape(course.name)}</td><td><input type="button" value="加選" /></td></tr>'
+
+        credit = sum(self.courses[c].credit for c in user.selected)
+
+        return web.Response(
+            text=(
+                f'<html><body><form id="aspnetForm" action="AddWithdraw.aspx?guid={guid}">'
+                f"{self._state_inputs()}"
+                f'<span id="ctl00_userInfo1_lblCreditUpperBound">{user.max_credit}</span>'
+                f'<span id="{prefix}_lblCredit">目前學分：{credit:02d}</span>'
+                f'<span id="{prefix}_lblMsgBlock">{escape(message)}</span>'
+                f'<table id="{prefix}_gvWishList"><tr><th>選課代號</th><th></th><th>科目名稱</th></tr>{wishlist_rows}</table>'
+                f'<table id="{prefix}_gvFunction"><tr><th></th><th>一</th><th>二</th><th>三</th><th>四</th><th>五</th><th>六</th><th>日</th></tr>{timetable_rows}</table>'
+                f'<table id="{prefix}_gvToAdd">{to_add}</table>'
+                "</form></body></html>"
+            ),
+            content_type="text/html",
+        )
+
+    # --- course.fcu.edu.tw ---
+
+    async def handle_index(self, request: web.Request):
+        self.requests["index"] += 1
+        return self._render_login()
+
+    async def handle_verify_code(self, request: web.Request):
+        self.requests["verify_code"] += 1
+        return web.Response(
+            body=verify_code_png(self.verify_code), content_type="image/png"
+        )
+
+    async def handle_login(self, request: web.Request):
+        self.requests["login"] += 1
+        form = await request.post()
+
+        if form.get("ctl00$Login1$vcode") != self.verify_code:
+            return self._render_login("驗證碼錯誤")
+
+        username = form.get("ctl00$Login1$UserName")
+        user = self.users.get(username)
+        if user is None:
+            user = self.users[username] = _User(
+                username, self.initial_selected, self.wishlist
+            )
+
+        # Drop the old session, like logging in somewhere else would.
+        for guid, u in list(self.guids.items()):
+            if u is user:
+                del self.guids[guid]
+
+        guid = secrets.token_hex(8)
+        self.guids[guid] = user
+        return self._render_service(guid, user)
+
+    def _add_course(self, user: _User, course_id: str):
+        course = self.courses.get(course_id)
+        if course is None:
+            return "查無此課程"
+
+        if course.selected >= course.quota:
+            return "已額滿"
+
+        occupied = 0
+        for course_id in user.selected:
+            occupied |= self.courses[course_id].slots
+        if timetable.conflicts(course.slots, occupied):
+            return "衝堂"
+
+        credit = sum(self.courses[c].credit for c in user.selected)
+        if credit + course.credit > user.max_credit:
+            return "不可超修"
+
+        if self.random.random() >= self.win_rate:
+            return "已額滿"
+
+        course.selected += 1
+        user.selected.append(course.id)
+        if course.id in user.wishlist:
+            user.wishlist.remove(course.id)
+        return "加選成功"
+
+    async def handle_postback(self, request: web.Request):
+        self.requests["postback"] += 1
+        guid = request.query.get("guid")
+        user = self.guids.get(guid)
+
+        if user is None or self.random.random() < self.error_rate:
+            return web.Response(
+                text='<html><body><span class="msg B1">請重新登入</span></body></html>',
+                content_type="text/html",
+            )
+
+        form = await request.post()
+        target = form.get("__EVENTTARGET", "")
+        message = ""
+
+        if form.get("ctl00$MainContent$TabContainer1$tabSelected$btnGetSub"):
+            self.requests["search"] += 1
+            course_id = form.get("ctl00$MainContent$TabContainer1$tabSelected$tbSubID")
+            user.searched = course_id if course_id in self.courses else None
+
+        elif target == "ctl00$MainContent$TabContainer1$tabSelected$gvToAdd":
+            self.requests["select"] += 1
+            message = (
+                self._add_course(user, user.searched) if user.searched else "查無此課程"
+            )
+
+        elif match := re.search(r"gvWishList\$ctl(\d+)\$btnAdd", target):
+            self.requests["select"] += 1
+            index = int(match.group(1)) - 2
+            message = (
+                self._add_course(user, user.wishlist[index])
+                if 0 <= index < len(user.wishlist)
+                else "查無此課程"
+            )
+
+        return self._render_service(guid, user, message)
+
+    # --- coursesearch ---
+
+    def _poll(self, course: StandInCourse):
+        if course.selected >= course.quota:
+            if self.random.random() < self.release_rate:
+                course.selected = course.quota - 1
+        elif self.random.random() < self.fill_rate:
+            course.selected = course.quota
+
+    async def handle_search(self, request: web.Request):
+        body = await request.json()
+        options = body.get("typeOptions", {})
+        items = []
+
+        if "code" in options:
+            self.requests["quota"] += 1
+            course = self.courses.get(options["code"]["value"])
+            if course is not None:
+                self._poll(course)
+                items.append(course.as_item())
+
+        elif "course" in options:
+            self.requests["course_id"] += 1
+            name = options["course"]["value"]
+            slot = timetable.slot(
+                int(options["weekPeriod"]["week"]),
+                int(options["weekPeriod"]["period"]),
+            )
+            items = [
+                c.as_item()
+                for c in self.courses.values()
+                if c.name == name and c.slots & slot
+            ]
+
+        else:
+            # any other query, e.g. a whole department, returns every course
+            self.requests["batch"] += 1
+            for course in self.courses.values():
+                self._poll(course)
+                items.append(course.as_item())
+
+        return web.json_response({"items": items})
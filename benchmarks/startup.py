@@ -0,0 +1,120 @@
+"""
+Startup benchmark: cold `import bot` time and RSS, each run in a fresh
+interpreter. Fails if either is over its threshold, or if a dependency that
+should load on first use (cv2, numpy, bs4) is imported with the package.
+
+    python -m benchmarks.startup --runs 10
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MIB = 1024 * 1024
+LAZY_MODULES = ("cv2", "numpy", "bs4")
+
+# must not import anything but the module under test, see `benchmarks.soak.get_rss`
+_PROBE = """
+import json, os, resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+try:
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+print(json.dumps({{
+    "elapsed": elapsed,
+    "rss": rss,
+    "loaded": [m for m in {lazy!r} if m in sys.modules],
+}}))
+"""
+
+
+def probe(module: str):
+    """
+    Import a module in a fresh interpreter.
+
+    Args:
+        module (str): Module to import.
+
+    Returns:
+        dict: elapsed seconds, rss bytes after import and the lazy modules that got loaded.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY_MODULES)],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def baseline_rss():
+    """
+    Returns:
+        int: RSS of a bare interpreter, to subtract from the import RSS.
+    """
+    return probe("sys")["rss"]
+
+
+def import_time_top(module: str, count: int):
+    """
+    Args:
+        module (str): Module to import.
+        count (int): Number of entries.
+
+    Returns:
+        List[str]: Slowest imports by cumulative time, from `python -X importtime`.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stderr
+    rows = [line.split("|") for line in stderr.splitlines() if line.startswith("import time:")][1:]
+    rows.sort(key=lambda row: int(row[1]), reverse=True)
+    return [f"{int(row[1]) / 1000:8.1f} ms  {row[2].rstrip()}" for row in rows[:count]]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--module", default="bot")
+    arg_parser.add_argument("--runs", type=int, default=10)
+    arg_parser.add_argument("--max-time", type=float, default=400, help="ms, median cold import time")
+    arg_parser.add_argument("--max-rss", type=float, default=32, help="MiB, median RSS added by the import")
+    arg_parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = arg_parser.parse_args()
+
+    base = baseline_rss()
+    results = [probe(args.module) for _ in range(args.runs)]
+    elapsed = statistics.median(r["elapsed"] for r in results) * 1000
+    rss = statistics.median(r["rss"] - base for r in results) / MIB
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    print(f"import {args.module}: {elapsed:.1f} ms, +{rss:.1f} MiB RSS (median of {args.runs})")
+    for line in import_time_top(args.module, args.top):
+        print(f"  {line}")
+
+    ok = True
+    if elapsed > args.max_time:
+        print(f"FAIL: import time {elapsed:.1f} ms > {args.max_time} ms")
+        ok = False
+    if rss > args.max_rss:
+        print(f"FAIL: RSS +{rss:.1f} MiB > {args.max_rss} MiB")
+        ok = False
+    if loaded:
+        print(f"FAIL: {', '.join(loaded)} imported on startup, should load on first use")
+        ok = False
+
+    if ok:
+        print("OK")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
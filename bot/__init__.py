@@ -1,26 +1,41 @@
 import asyncio
+import itertools
 import json
 import logging
+import os
 import re
-from copy import deepcopy
+import time
+from collections import deque
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import List
+from typing import TYPE_CHECKING, Callable, Deque, List, Union
 
 from aiohttp import ClientSession
-from bs4 import BeautifulSoup
 
-from . import parser, search
+from . import events, metrics, parser, profiling, search, shadow, timetable, tracing
 from .error import *
 from .form_data import *
+from .hidden_state import HiddenState, encode_form
 from .notification import Notification
+from .planner import Planner
+from .polling import FixedDelay, PollingStrategy
+from .resources import Resources
 from .search import SearchOption
-from .utils import check_response
+from .shadow import Recorder as ShadowRecorder
 from .verify_code_parser import parse_veify_code
 
+if TYPE_CHECKING:
+    from .history import QuotaLog
+
 __author__ = "IanDesuyo"
 __version__ = "0.2.0"
 
+# names debug request dumps, unique across bots and runs
+_request_ids = itertools.count(int(time.time() * 1000))
+
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
 
 class Strategy(Enum):
     NEW = 0
@@ -51,6 +66,7 @@ class TargetCourse:
         self.use_wishlist = use_wishlist
         self.strategy = strategy
         self.changeable_course_ids = changeable_course_ids
+        self.slots: int = None  # timetable bitmap, learned from the first poll
 
         if self.strategy == Strategy.DROP_THEN_CHANGE:
             raise ValueError("Strategy.DROP_THEN_CHANGE is not supported yet.")
@@ -60,6 +76,14 @@ class TargetCourse:
                 "If you are using Strategy.DROP_THEN_CHANGE, you need to specify the changeable course IDs."
             )
 
+    def as_dict(self):
+        return {
+            "course_id": self.course_id,
+            "credit": self.credit,
+            "use_wishlist": self.use_wishlist,
+            "strategy": self.strategy.name,
+        }
+
 
 class Account:
     def __init__(self, username: str, password: str):
@@ -90,6 +114,15 @@ class FcuCourseMaster:
         notification_webhook: str = None,
         search_option: SearchOption = SearchOption(),
         debug: bool = False,
+        parse_executor: Union[str, Executor] = None,
+        trace: bool = False,
+        profile: str = None,
+        course_url: str = "https://course.fcu.edu.tw",
+        armed: bool = False,
+        quota_log: Union[str, "QuotaLog"] = None,
+        polling: PollingStrategy = None,
+        shadow: Union[bool, ShadowRecorder] = False,
+        resources: Resources = None,
     ):
         """
         A super powerful course selection tool for FCU.
@@ -101,40 +134,117 @@ class FcuCourseMaster:
             notification_webhook (str, optional): Discord webhook URL or Line Notify token. Defaults to None.
             search_option (SearchOption, optional): Search option. Defaults to SearchOption().
             debug (bool, optional): Debug mode. Defaults to False.
+            parse_executor (Union[str, Executor], optional): Where to parse response pages, "thread", "process" or an Executor. Pools are shared between bots. Defaults to None (parse on the event loop).
+            trace (bool, optional): Record connection-level phase timings of every request, see `bot.tracing`. Defaults to False.
+            profile (str, optional): Directory to write cProfile profiles of the parse, decode, build and verify_code phases to, see `bot.profiling`. Work in parse_executor is not profiled. Defaults to None.
+            course_url (str, optional): Login site, only change it to run against a stand-in server. Defaults to "https://course.fcu.edu.tw".
+            armed (bool, optional): Keep the first target course that is not wishlisted searched ahead of time, so selecting it is a single postback. Defaults to False.
+            quota_log (Union[str, QuotaLog], optional): Path of a quota history log to append every poll to, see `bot.history`. Defaults to None.
+            polling (PollingStrategy, optional): Which target courses to poll on each tick and how long to wait between ticks, see `bot.polling`. Defaults to FixedDelay(search_option.delay).
+            shadow (Union[bool, ShadowRecorder], optional): Dry run, build the final add postback but never send it, and record a timeline of each select into a recorder, see `bot.shadow`. Only use it against a stand-in. Defaults to False.
+            resources (Resources, optional): Share the connection pool, DNS cache and notification session with other bots, see `bot.resources`. Cookies stay per bot. Defaults to None (own sessions).
         """
         self.logger = logging.getLogger(username)
         self.search_option = search_option
+        self.polling = polling or FixedDelay(search_option.delay)
 
         self.account = Account(username, password)
-        self.target_courses = target_courses
-        self.notification = Notification(self.account.username, notification_webhook)
+        self.resources = resources
+        self.notification = Notification(
+            self.account.username,
+            notification_webhook,
+            resources.notification_session() if resources else None,
+        )
         self.selected_courses = {}
         self.wishlisted_courses = {}
         self.wishlisted_course_state = {}
         self.max_credit = 25
         self.current_credit = 0
+        self.occupied_slots = 0  # timetable bitmap of selected courses
+        # numpy is loaded with the first bot, not on import
+        from .quota import QuotaTable
+
+        self.quota_table = QuotaTable()
+        self.quota_log = quota_log
+        self.owns_quota_log = isinstance(quota_log, str)
+        if self.owns_quota_log:
+            from .history import QuotaLog
+
+            self.quota_log = QuotaLog.shared(quota_log)
 
+        self.course_url = course_url
         self.service_url = "https://service100-sds.fcu.edu.tw"
         self.service_path = "/"
         self.heartbeat: datetime = None
-        self.session = ClientSession(
+        self.session = (resources.session if resources else ClientSession)(
             headers={
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4577.63 Safari/537.36"
-            }
+            },
+            trace_configs=[tracing.create_trace_config()] if trace else None,
         )
-        self.current_state = {}
+        if trace:
+            search.enable_tracing()
+        if resources is None:
+            # the last bot closes the search client, or `resources` does
+            search.acquire()
+        self.closed = False
+        self.current_state: HiddenState = None
         self.cached_verify_code: str = None
+        self.profiler = profiling.create_profiler(profile)
+        self.armed = armed
+        self.armed_course_id: str = None
+        self.unarmable_course_ids = set()
+        self.shadow: ShadowRecorder = ShadowRecorder() if shadow is True else shadow or None
+        self.planner = Planner(self.check_course, target_courses)
+
+        # runtime control, see `bot.control`
+        self.paused = False
+        self.exit_when_done = True
+        self.pending_changes: Deque[Callable[[], None]] = deque()
+        self.parse_executor = (
+            parser.get_executor(parse_executor)
+            if isinstance(parse_executor, str)
+            else parse_executor
+        )
 
         self.debug = debug
         if self.debug:
             self.logger.setLevel(logging.DEBUG)
-            import os
-
             os.makedirs("./debug/requests", exist_ok=True)
             os.makedirs("./debug/responses", exist_ok=True)
+            os.makedirs("./debug/states", exist_ok=True)
 
-    def __del__(self):
-        asyncio.get_event_loop().run_until_complete(self.session.close())
+    @property
+    def target_courses(self):
+        """
+        Target courses in priority order, including blocked ones. Use `planner` to change them.
+        """
+        return self.planner.targets
+
+    async def close(self):
+        """
+        Close the sessions of the bot, the search client if it is the last bot using it,
+        and the quota log if the bot opened it. Shared ones are closed by `resources`.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        await self.session.close()
+        await self.notification.close()
+        if self.resources is None:
+            await search.release()
+
+        if self.owns_quota_log:
+            self.quota_log.close()
+        elif self.quota_log:
+            self.quota_log.flush()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
 
     async def get_verify_code(self, get_new: bool = False):
         """
@@ -153,11 +263,13 @@ class FcuCourseMaster:
             self.logger.info(
                 "[VerifyCode] Using cached verify code. (%s)", self.cached_verify_code
             )
+            metrics.CACHE_TOTAL.inc(cache="verify_code", result="hit")
             return self.cached_verify_code
 
+        metrics.CACHE_TOTAL.inc(cache="verify_code", result="miss")
         self.logger.info("[VerifyCode] Getting verify code...")
 
-        async with self.session.get("https://course.fcu.edu.tw/validateCode.aspx") as r:
+        async with self.session.get(f"{self.course_url}/validateCode.aspx") as r:
             data = await r.read()
 
             # --- DEBUG: save verify code image ---
@@ -168,12 +280,218 @@ class FcuCourseMaster:
                 self.logger.debug("[VerifyCode] Verify code image saved.")
             # --- DEBUG: save verify code image ---
 
-            self.cached_verify_code = parse_veify_code(data)
+            with self.profiler.phase("verify_code"):
+                self.cached_verify_code = parse_veify_code(data)
             self.logger.info(
                 "[VerifyCode] Got verify code. (%s)", self.cached_verify_code
             )
             return self.cached_verify_code
 
+    async def parse(self, html: str, state_only: bool = False):
+        """
+        Parse a response page, in the parse executor if there is one.
+
+        Args:
+            html (str): Response HTML.
+            state_only (bool, optional): Only parse ASP.NET state. Defaults to False.
+
+        Returns:
+            parser.ParsedPage: Parsed page.
+        """
+        parse = parser.parse_state_page if state_only else parser.parse_page
+
+        if self.parse_executor is None:
+            with self.profiler.phase("parse"):
+                return parse(html)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self.parse_executor, parse, html
+        )
+
+    async def update_state(self, page: parser.ParsedPage):
+        """
+        Update user's state from a parsed page.
+
+        Args:
+            page (parser.ParsedPage): Parsed page.
+        """
+        if page.current_credit != self.current_credit:
+            events.emit(events.StateChange(self.account.username, "credit", page.current_credit))
+
+        state = HiddenState.get(page.state)
+        if state is not self.current_state and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("[State] %r, changed %s", state, state.diff(self.current_state))
+
+        self.heartbeat = datetime.now()
+        self.current_state = state
+        self.service_path = page.service_path
+        self.wishlisted_courses = page.wishlisted_courses
+        self.wishlisted_course_state = page.wishlisted_course_state
+        self.max_credit = page.max_credit
+        self.current_credit = page.current_credit
+        self.occupied_slots = timetable.from_cells(page.timetable)
+        selected_courses = await parser.get_selected_courses(
+            self.search_option, page.timetable
+        )
+        if selected_courses.keys() != self.selected_courses.keys():
+            events.emit(
+                events.StateChange(self.account.username, "selected_courses", list(selected_courses))
+            )
+            for course_id in selected_courses.keys() - self.selected_courses.keys():
+                if self.planner.remove(course_id):
+                    self.logger.info("%s is selected, removed from targets.", course_id)
+        self.selected_courses = selected_courses
+
+        self.replan()
+
+    def replan(self):
+        """
+        Check again the target courses affected by a timetable or credit change.
+        """
+        blocked, unblocked = self.planner.update(
+            self.occupied_slots, self.max_credit - self.current_credit
+        )
+        for course, e in blocked:
+            self.logger.warning("%s skipped: %s", course.course_id, e)
+        for course in unblocked:
+            self.logger.info("%s can be selected again.", course.course_id)
+
+    def add_target(self, course: TargetCourse, index: int = None):
+        """
+        Add a target course on the next tick.
+
+        Args:
+            course (TargetCourse): Target course.
+            index (int, optional): Position in the polling order. Defaults to None (last).
+        """
+
+        def change():
+            if course.course_id in self.planner:
+                return
+            e = self.planner.add(course, index)
+            self.logger.info("[Control] %s added.", course.course_id)
+            if e:
+                self.logger.warning("%s skipped: %s", course.course_id, e)
+
+        self.pending_changes.append(change)
+
+    def remove_target(self, course_id: str):
+        """
+        Remove a target course on the next tick.
+
+        Args:
+            course_id (str): Course ID.
+        """
+
+        def change():
+            self.planner.remove(course_id)
+            self.logger.info("[Control] %s removed.", course_id)
+
+        self.pending_changes.append(change)
+
+    def reprioritize(self, course_id: str, index: int):
+        """
+        Move a target course in the polling order on the next tick.
+
+        Args:
+            course_id (str): Course ID.
+            index (int): New position, 0 is polled first.
+        """
+
+        def change():
+            if self.planner.move(course_id, index):
+                self.logger.info("[Control] %s moved to %d.", course_id, index)
+
+        self.pending_changes.append(change)
+
+    def pause(self):
+        """
+        Stop polling on the next tick. Keep-alives continue.
+        """
+        self.pending_changes.append(lambda: self._set_paused(True))
+
+    def resume(self):
+        """
+        Resume polling on the next tick.
+        """
+        self.pending_changes.append(lambda: self._set_paused(False))
+
+    def _set_paused(self, paused: bool):
+        self.paused = paused
+        events.emit(events.StateChange(self.account.username, "paused", paused))
+
+    def apply_pending_changes(self):
+        while self.pending_changes:
+            change = self.pending_changes.popleft()
+            try:
+                change()
+            except Exception as e:
+                # a bad change must not end the tick, which would log in again
+                self.logger.exception("[Control] Change dropped: %s", e)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: JSON serializable session state.
+        """
+        return {
+            "username": self.account.username,
+            "paused": self.paused,
+            "heartbeat": self.heartbeat.isoformat() if self.heartbeat else None,
+            "credit": {"current": self.current_credit, "max": self.max_credit},
+            "selected_courses": self.selected_courses,
+            "wishlisted_courses": self.wishlisted_courses,
+            "armed_course_id": self.armed_course_id,
+            "target_courses": [c.as_dict() for c in self.target_courses],
+            "blocked_courses": {course_id: str(e) for course_id, e in self.planner.blocked.items()},
+            "quota": self.quota_table.as_dict(),
+            "pending_changes": len(self.pending_changes),
+        }
+
+    def check_course(self, course: TargetCourse):
+        """
+        Check locally whether a course can still be selected, without a round trip.
+
+        Args:
+            course (TargetCourse): Target course.
+
+        Raises:
+            CourseConflict: The course clashes with selected courses.
+            CreditNotEnough: Selecting the course would exceed max credit.
+        """
+        if course.slots and timetable.conflicts(course.slots, self.occupied_slots):
+            raise CourseConflict(
+                f"{course.course_id} conflicts with selected courses at {timetable.format_slots(course.slots & self.occupied_slots)}."
+            )
+
+        if (
+            course.credit > self.max_credit - self.current_credit
+            and course.strategy == Strategy.NEW
+        ):
+            raise CreditNotEnough(f"{course.course_id} credit exceeds limit.")
+
+    def encode_postback(self, payload: dict):
+        """
+        Encode a postback form body with the current ASP.NET state.
+
+        Args:
+            payload (dict): Form Data to send.
+
+        Raises:
+            SessionExpired: No postback for 10 minutes.
+
+        Returns:
+            bytes: Form body.
+        """
+        if datetime.now() - self.heartbeat > timedelta(minutes=10):
+            raise SessionExpired("Session expired.")
+
+        with self.profiler.phase("build"):
+            data = encode_form(payload, self.current_state)
+        shadow.mark("payload_built")
+        return data
+
+    @metrics.timed("postback")
     async def postback(self, payload: dict, retry: int = 3):
         """
         Postback to server.
@@ -185,65 +503,61 @@ class FcuCourseMaster:
 
         Returns:
             ClientResponse: Response from server.
-            BeautifulSoup: Parsed HTML.
+            parser.ParsedPage: Parsed page.
         """
-        if datetime.now() - self.heartbeat > timedelta(minutes=10):
-            raise SessionExpired("Session expired.")
+        state = self.current_state
+        data = self.encode_postback(payload)
 
-        _payload = deepcopy(payload)
-        _payload.update(self.current_state)
+        # any postback replaces the page, the armed course must be searched again
+        self.armed_course_id = None
 
-        debug_request_nonce = int(datetime.now().timestamp() * 1000)
+        debug_request_nonce = next(_request_ids)
         self.logger.debug(
             "[Request][%d] %s %s", debug_request_nonce, "POST", self.service_path
         )
 
+        shadow.mark("request_sent")
         res = await self.session.post(
-            f"{self.service_url}/{self.service_path}", data=_payload
+            f"{self.service_url}/{self.service_path}",
+            data=data,
+            headers=FORM_HEADERS,
         )
-        soup = BeautifulSoup(await res.text(), "html.parser")
+        html = await res.text()
 
         # --- DEBUG: save response html ---
         if self.debug:
+            # hidden state is dumped once per digest, requests refer to it
+            state_path = f"./debug/states/{state.digest.hex()}.json"
+            if not os.path.exists(state_path):
+                with open(state_path, "w", encoding="utf-8") as f:
+                    json.dump(state.as_dict(), f, ensure_ascii=False, indent=4)
             with open(
                 f"./debug/requests/{debug_request_nonce}.json", "w", encoding="utf-8"
             ) as f:
-                json.dump(_payload, f, ensure_ascii=False, indent=4)
+                json.dump(
+                    {**payload, "state": state.digest.hex()}, f, ensure_ascii=False, indent=4
+                )
             with open(
                 f"./debug/responses/{debug_request_nonce}.html", "w", encoding="utf-8"
             ) as f:
-                f.write(soup.prettify())
+                f.write(html)
 
         # --- DEBUG: save response html ---
 
-        check_response(soup)
+        page = await self.parse(html)
+        page.raise_for_error()
 
         # update state
-        self.heartbeat = datetime.now()
-        self.current_state = parser.get_state(soup)
-        (
-            self.service_path,
-            self.selected_courses,
-            self.wishlisted_courses,
-            self.wishlisted_course_state,
-            self.max_credit,
-            self.current_credit,
-        ) = await parser.get_user_state(self.search_option, soup)
-
-        # TODO: Make sure the queryselector is correct.
-        # Maybe we can keep cached captcha in payload to avoid this?
-        captcha_required = soup.select_one(
-            "#ctl00_MainContent_TabContainer1_tabSelected_CAPTCHA_imgCAPTCHA"
-        )
-        # ctl00$MainContent$TabContainer1$tabSelected$CAPTCHA$tbCAPTCHA
+        await self.update_state(page)
+
         self.logger.debug(
             "[Request][%d] %d %s %d",
             debug_request_nonce,
             res.status,
             res.reason,
-            bool(captcha_required),
+            page.captcha_required,
         )
-        if captcha_required:
+        if page.captcha_required:
             self.logger.warning(
                 "[Request][%d] Captcha required. Relogin...", debug_request_nonce
             )
@@ -255,8 +569,10 @@ class FcuCourseMaster:
 
             raise CaptchaRequired("Captcha required but retry limit reached.")
 
-        return res, soup
+        return res, page
 
+    @metrics.timed("login")
+    @tracing.operation("login")
     async def login(self):
         """
         Login to server.
@@ -266,24 +582,28 @@ class FcuCourseMaster:
             NotServiceTime: Not service time.
         """
         self.logger.info("[Login] Getting initial state...")
+        self.unarmable_course_ids.clear()
 
-        async with self.session.get("https://course.fcu.edu.tw/") as r:
-            soup = BeautifulSoup(await r.text(), "html.parser")
-            self.current_state = parser.get_state(soup)
+        async with self.session.get(f"{self.course_url}/") as r:
+            page = await self.parse(await r.text(), state_only=True)
+            self.current_state = HiddenState.get(page.state)
 
         self.logger.info("[Login] Logging in...")
 
         async with self.session.post(
-            "https://course.fcu.edu.tw/Login.aspx",
-            data={
-                **LOGIN,
-                **self.current_state,
-                "ctl00$Login1$UserName": self.account.username,
-                "ctl00$Login1$Password": self.account.password,
-                "ctl00$Login1$vcode": await self.get_verify_code(),
-            },
+            f"{self.course_url}/Login.aspx",
+            data=encode_form(
+                {
+                    **LOGIN,
+                    "ctl00$Login1$UserName": self.account.username,
+                    "ctl00$Login1$Password": self.account.password,
+                    "ctl00$Login1$vcode": await self.get_verify_code(),
+                },
+                self.current_state,
+            ),
+            headers=FORM_HEADERS,
         ) as r:
-            soup = BeautifulSoup(await r.text(), "html.parser")
+            html = await r.text()
 
             # --- DEBUG: save response html ---
             if self.debug:
@@ -292,27 +612,65 @@ class FcuCourseMaster:
                     "w",
                     encoding="utf-8",
                 ) as f:
-                    f.write(soup.prettify())
+                    f.write(html)
             # --- DEBUG: save response html ---
 
-            check_response(soup)
+            page = await self.parse(html)
+            page.raise_for_error()
 
-            self.service_url = f"{r.real_url.scheme}://{r.real_url.host}"
-            self.logger.debug(f"[Login] service_url: {self.service_url}")
+            self.service_url = str(r.real_url.origin())
+            self.logger.debug("[Login] service_url: %s", self.service_url)
 
             # update state
-            self.heartbeat = datetime.now()
-            self.current_state = parser.get_state(soup)
-            (
-                self.service_path,
-                self.selected_courses,
-                self.wishlisted_courses,
-                self.wishlisted_course_state,
-                self.max_credit,
-                self.current_credit,
-            ) = await parser.get_user_state(self.search_option, soup)
-
-        self.logger.info(f"[Login] Logged in as {self.account.username}")
+            await self.update_state(page)
+
+        self.logger.info("[Login] Logged in as %s", self.account.username)
+        events.emit(events.StateChange(self.account.username, "login", self.service_url))
+
+    async def prepare(self):
+        """
+        Login, show current courses and add target courses to the wishlist.
+        Target courses that are selected or can not be selected are taken out of the plan on login.
+        """
+        await self.login()
+
+        # show current courses
+        self.logger.info("Credit: %d/%d", self.current_credit, self.max_credit)
+        self.logger.info("Selected courses:")
+        self.logger.info(
+            ", ".join(
+                [
+                    f"{course_id}({course_name})"
+                    for course_id, course_name in self.selected_courses.items()
+                ]
+            )
+        )
+        self.logger.info("Wishlisted courses:")
+        self.logger.info(
+            ", ".join(
+                [
+                    f"{course_id}({course_name})"
+                    for course_id, course_name in self.wishlisted_courses.items()
+                ]
+            )
+        )
+
+        # add all target courses with use_wishlist to wishlist
+        for course in self.planner.feasible():
+            if (
+                course.use_wishlist
+                and course.course_id not in self.wishlisted_courses
+            ):
+                try:
+                    await self.add_wishlist(course.course_id)
+
+                except CourseNotFound as e:
+                    self.logger.warning("%s not found.", course.course_id)
+                    events.emit(events.Error.of(self.account.username, e, course.course_id))
+                    self.planner.remove(course.course_id)
+                    await self.notification.error(
+                        f"Course {course.course_id} not found."
+                    )
 
     async def start(self):
         """
@@ -321,131 +679,129 @@ class FcuCourseMaster:
 
         while True:
             try:
-                await self.login()
-
-                # show current courses
-                self.logger.info(f"Credit: {self.current_credit}/{self.max_credit}")
-                self.logger.info("Selected courses:")
-                self.logger.info(
-                    ", ".join(
-                        [
-                            f"{course_id}({course_name})"
-                            for course_id, course_name in self.selected_courses.items()
-                        ]
-                    )
-                )
-                self.logger.info("Wishlisted courses:")
-                self.logger.info(
-                    ", ".join(
-                        [
-                            f"{course_id}({course_name})"
-                            for course_id, course_name in self.wishlisted_courses.items()
-                        ]
-                    )
-                )
-
-                # add all target courses with use_wishlist to wishlist
-                for course in self.target_courses:
-                    if course.course_id in self.selected_courses:
-                        self.logger.warning("%s already selected.", course.course_id)
-                        self.target_courses.remove(course)
-                        continue
-
-                    if (
-                        course.credit > self.max_credit - self.current_credit
-                        and course.strategy == Strategy.NEW
-                    ):
-                        self.logger.warning(
-                            "%s credit exceeds limit.", course.course_id
-                        )
-                        self.target_courses.remove(course)
-                        continue
-
-                    if (
-                        course.use_wishlist
-                        and course.course_id not in self.wishlisted_courses
-                    ):
-                        try:
-                            await self.add_wishlist(course.course_id)
-
-                        except CourseNotFound:
-                            self.logger.warning("%s not found.", course.course_id)
-                            self.target_courses.remove(course)
-                            await self.notification.error(
-                                f"Course {course.course_id} not found."
-                            )
+                await self.prepare()
 
                 while True:
+                    self.apply_pending_changes()
+
                     if datetime.now() - self.heartbeat > timedelta(minutes=8):
                         self.logger.info("Keep session alive...")
-                        await self.postback({**BASIC_STATE})
+                        with tracing.operation("keepalive"):
+                            await self.postback({**BASIC_STATE})
+
+                    if not self.paused:
+                        await self.rearm()
+
+                        if self.polling.batch is not None:
+                            items = await search.search_courses(
+                                self.search_option, self.polling.batch, self.quota_table
+                            )
+                            self.polling.observe_batch(
+                                [item["scr_selcode"] for item in items], time.time()
+                            )
+
+                    targets = self.planner.feasible()
+                    target_ids = [course.course_id for course in targets]
+                    due = set(self.polling.due(target_ids, self.quota_table, time.time()))
+                    # courses that just gained a free seat are tried first
+                    opened = set(self.quota_table.openings(target_ids))
+
+                    for course in [] if self.paused else sorted(targets, key=lambda c: c.course_id not in opened):
+                        # an earlier select of this tick may have changed the plan
+                        if course.course_id not in due or not self.planner.is_feasible(course.course_id):
+                            continue
 
-                    for course in self.target_courses:
                         try:
-                            course_data, course_has_quota = (
-                                await search.get_course_data(
-                                    self.search_option, course.course_id
-                                )
+                            if self.shadow is not None:
+                                shadow.begin(self.shadow, course.course_id)
+
+                            quota, selected = await search.poll_quota(
+                                self.search_option,
+                                course.course_id,
+                                self.quota_table,
                             )
 
-                            if not course_has_quota:
+                            self.polling.observe(course.course_id, quota, selected, time.time())
+                            if self.quota_log:
+                                self.quota_log.write(course.course_id, quota, selected)
+
+                            e = self.planner.learn_slots(
+                                course, search.course_slots(self.search_option, course.course_id)
+                            )
+                            if e:
+                                self.logger.warning("%s skipped: %s", course.course_id, e)
                                 continue
 
-                            if await self.select_course(course.course_id):
+                            if selected >= quota:
+                                continue
+
+                            quota_detected_at = time.perf_counter()
+                            shadow.mark("decision")
+                            success = await self.select_course(course.course_id)
+
+                            if success:
+                                metrics.QUOTA_TO_SELECT_SECONDS.observe(
+                                    time.perf_counter() - quota_detected_at
+                                )
                                 await self.notification.select_successful(
-                                    course_data,
+                                    search.course_data(
+                                        self.search_option, course.course_id, quota, selected
+                                    ),
                                     self.max_credit,
                                     self.current_credit,
                                 )
                                 self.logger.info("%s selected.", course.course_id)
-                                self.target_courses.remove(course)
-
-                                # remove all courses that credit exceeds max credit
-                                credits = self.max_credit - self.current_credit
-                                for c in self.target_courses:
-                                    if c.credit > credits:
-                                        self.logger.info(
-                                            "%s removed because credit exceeds max credit.",
-                                            c.course_id,
-                                        )
-                                        self.target_courses.remove(c)
-
-                        except CourseNotFound:
+                                # courses that no longer fit were blocked by replan() on the postback
+                                self.planner.remove(course.course_id)
+
+                        except CourseNotFound as e:
                             self.logger.warning("%s not found.", course.course_id)
-                            self.target_courses.remove(course)
+                            events.emit(events.Error.of(self.account.username, e, course.course_id))
+                            self.planner.remove(course.course_id)
                             await self.notification.error(
                                 f"Course {course.course_id} not found."
                             )
 
-                        except CourseNotSelectabled:
+                        except CourseNotSelectabled as e:
                             self.logger.warning("%s not selectable.", course.course_id)
-                            self.target_courses.remove(course)
+                            events.emit(events.Error.of(self.account.username, e, course.course_id))
+                            self.planner.remove(course.course_id)
                             await self.notification.error(
                                 f"Course {course.course_id} not selectable."
                             )
 
                         except CreditNotEnough:
-                            self.target_courses.remove(course)
+                            self.planner.remove(course.course_id)
 
-                    if len(self.target_courses) == 0:
+                    # blocked courses are still polled, a drop may make them fit again
+                    if not self.planner and self.exit_when_done:
                         self.logger.info("All target courses selected.")
                         break
 
-                    await asyncio.sleep(self.search_option.delay)
+                    await asyncio.sleep(
+                        self.search_option.delay if self.paused else self.polling.delay(time.time())
+                    )
 
             except Exception as e:
                 self.logger.exception(e)
+                events.emit(events.Error.of(self.account.username, e))
                 self.cached_verify_code = None
                 if getattr(e, "should_exit", False):
                     break
 
-            if len(self.target_courses) == 0:
+            if not self.planner and self.exit_when_done:
                 break
 
             self.logger.info("[Client] Waiting 5 seconds before retry...")
 
             await asyncio.sleep(5)
 
+        self.profiler.dump()
+        if self.quota_log:
+            self.quota_log.flush()
+
+    @metrics.timed("select")
+    @tracing.operation("select")
     async def select_course(self, course_id: str):
         self.logger.info("[Select] Selecting %s...", course_id)
 
@@ -455,37 +811,43 @@ class FcuCourseMaster:
             if not state.select_event:
                 raise CourseNotSelectabled(f"{course_id} is not open for selection.")
 
-            req, soup = await self.postback(
-                {
-                    **SELECT_FROM_WISHLIST,
-                    "__EVENTTARGET": state.select_event,
-                }
-            )
+            payload = {
+                **SELECT_FROM_WISHLIST,
+                "__EVENTTARGET": state.select_event,
+            }
 
         else:
-            res, soup = await self.postback(
-                {
-                    **DIRECT_SEARCH_COURSE,
-                    "ctl00$MainContent$TabContainer1$tabSelected$tbSubID": course_id,
-                },
-            )
-
-            if not soup.select_one(
-                "#ctl00_MainContent_TabContainer1_tabSelected_gvToAdd input[value='加選']"
-            ):
-                raise CourseNotSelectabled(f"{course_id} is not open for selection.")
+            if course_id == self.armed_course_id:
+                metrics.CACHE_TOTAL.inc(cache="armed", result="hit")
+            else:
+                metrics.CACHE_TOTAL.inc(cache="armed", result="miss")
+                await self.arm_course(course_id)
+
+            payload = {
+                **SELECT_DIRECT_SEARCHED_COURSE,
+            }
 
-            res, soup = await self.postback(
-                {
-                    **SELECT_DIRECT_SEARCHED_COURSE,
-                }
+        if self.shadow is not None:
+            # stop right before the add postback, the page and armed course stay as they are
+            self.encode_postback(payload)
+            shadow.finish()
+            self.logger.debug("[Shadow] %s would be selected now.", course_id)
+            return False
+
+        res, page = await self.postback(payload)
+
+        events.emit(
+            events.SelectAttempt(
+                self.account.username,
+                course_id,
+                page.message is not None and "加選成功" in page.message,
+                page.message,
+                course_id in self.wishlisted_course_state,
             )
-
-        msg_span = soup.select_one(
-            "#ctl00_MainContent_TabContainer1_tabSelected_lblMsgBlock"
         )
-        if msg_span:
-            msg = msg_span.text.strip()
+
+        if page.message:
+            msg = page.message
             if "不可超修" in msg:
                 raise CreditNotEnough(msg)
 
@@ -503,6 +865,65 @@ class FcuCourseMaster:
 
         return False
 
+    @tracing.operation("arm")
+    async def arm_course(self, course_id: str):
+        """
+        Search a course into the add grid, so the next postback can select it directly.
+
+        Args:
+            course_id (str): Course ID.
+
+        Raises:
+            CourseNotSelectabled: The course is not open for selection.
+        """
+        res, page = await self.postback(
+            {
+                **DIRECT_SEARCH_COURSE,
+                "ctl00$MainContent$TabContainer1$tabSelected$tbSubID": course_id,
+            },
+        )
+
+        if not page.can_add_searched:
+            raise CourseNotSelectabled(f"{course_id} is not open for selection.")
+
+        self.armed_course_id = course_id
+
+    async def rearm(self, target_courses: List[TargetCourse] = None):
+        """
+        Arm the first target course that is not wishlisted, if it is not armed yet.
+        Does nothing unless armed mode is on.
+
+        Args:
+            target_courses (List[TargetCourse], optional): Candidates in priority order. Defaults to the feasible target courses.
+        """
+        if not self.armed:
+            return
+
+        for course in self.planner.feasible() if target_courses is None else target_courses:
+            if (
+                course.course_id in self.wishlisted_course_state
+                or course.course_id in self.selected_courses
+                or course.course_id in self.unarmable_course_ids
+            ):
+                continue
+
+            try:
+                self.check_course(course)
+            except (CourseConflict, CreditNotEnough):
+                continue
+
+            if course.course_id == self.armed_course_id:
+                return
+
+            try:
+                await self.arm_course(course.course_id)
+                self.logger.debug("[Arm] %s armed.", course.course_id)
+                return
+
+            except CourseNotSelectabled:
+                # leave it to select_course, which will raise for it
+                self.unarmable_course_ids.add(course.course_id)
+
     async def add_wishlist(self, course_id: str):
         raise DeprecationWarning(
             "add_wishlist is deprecated. Please maunally add course to wishlist at https://coursesearch01.fcu.edu.tw"
@@ -511,33 +932,29 @@ class FcuCourseMaster:
         if course_id in self.wishlisted_courses:
             return
 
-        self.logger.info(f"[Wishlist] Adding {course_id} to wishlist...")
+        self.logger.info("[Wishlist] Adding %s to wishlist...", course_id)
 
-        res, soup = await self.postback(
+        res, page = await self.postback(
             {
                 **SEARCH_COURSE,
                 "ctl00$MainContent$TabContainer1$tabCourseSearch$wcCourseSearch$tbSubID": course_id,
             },
         )
 
-        select_btn = soup.select_one(
-            "#ctl00_MainContent_TabContainer1_tabCourseSearch_wcCourseSearch_gvSearchResult input[value='關注']"
-        )
-
-        if not select_btn:
+        if not page.search_result_button:
             raise CourseNotFound(f"Course {course_id} not found.")
 
-        res, soup = await self.postback(
+        res, page = await self.postback(
             {
                 **WISHLIST_SEARCHED_COURSE,
-                select_btn.get("name"): "關注",
+                page.search_result_button: "關注",
             },
         )
 
         if course_id not in self.wishlisted_courses:
             raise ServerException("Failed to add course to wishlist.")
 
-        self.logger.info(f"[Wishlist] {course_id} added to wishlist.")
+        self.logger.info("[Wishlist] %s added to wishlist.", course_id)
 
     async def remove_wishlist(self, course_id: str):
         raise DeprecationWarning(
@@ -546,16 +963,16 @@ class FcuCourseMaster:
         if course_id not in self.wishlisted_courses:
             return
 
-        self.logger.info(f"[Wishlist] Removing {course_id} from wishlist...")
+        self.logger.info("[Wishlist] Removing %s from wishlist...", course_id)
 
         state = self.wishlisted_course_state.get(course_id)
 
         if not state:
-            self.logger.error(f"[Wishlist] {course_id}'s state not found.")
+            self.logger.error("[Wishlist] %s's state not found.", course_id)
             return
 
         # TODO: remove wishlist
-        res, soup = await self.postback(
+        res, page = await self.postback(
             {
                 **REMOVE_WISHLIST,
                 "__EVENTTARGET": state.remove_event,
@@ -565,4 +982,4 @@ class FcuCourseMaster:
         if course_id in self.wishlisted_courses:
             raise ServerException("Failed to remove course from wishlist.")
 
-        self.logger.info(f"[Wishlist] {course_id} removed from wishlist.")
+        self.logger.info("[Wishlist] %s removed from wishlist.", course_id)
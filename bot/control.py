@@ -0,0 +1,145 @@
+"""
+Local control API for a running bot.
+
+Works with `FcuCourseMaster` and `MutliAccountBot` (multi_account.py), which
+both queue the changes and apply them on their next scheduler tick, so the
+session is never logged in again.
+
+    GET    /state                        current session state
+    POST   /targets                      {"course_id": "1234", "credit": 2, "use_wishlist": false, "index": 0}
+                                         add "bot_indexes": [0, 1] for MutliAccountBot
+    DELETE /targets/{course_id}          remove a target
+    POST   /targets/{course_id}/priority {"index": 0}, move a target, 0 is polled first
+    POST   /pause                        stop polling, keep-alives continue
+    POST   /resume                       resume polling
+
+    curl --unix-socket ./bot.sock http://localhost/state
+"""
+
+import json
+import logging
+
+from aiohttp import web
+
+from . import TargetCourse
+
+logger = logging.getLogger(__name__)
+
+
+def _index(value, size: int):
+    """
+    Args:
+        value: Position from a request body.
+        size (int): Number of target courses.
+
+    Raises:
+        ValueError: Not an integer in [0, size].
+
+    Returns:
+        int: Position.
+    """
+    index = int(value)
+    if not 0 <= index <= size:
+        raise ValueError(f"index {index} is out of range 0-{size}")
+    return index
+
+
+async def _json_object(request: web.Request):
+    """
+    Raises:
+        ValueError: The body is not a JSON object.
+
+    Returns:
+        dict: Request body.
+    """
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError("body must be a JSON object")
+    return body
+
+
+def _create_app(bot):
+    routes = web.RouteTableDef()
+
+    def ok():
+        return web.json_response({"ok": True, "applies": "next tick"})
+
+    @routes.get("/state")
+    async def state(request: web.Request):
+        return web.json_response(bot.snapshot())
+
+    @routes.post("/targets")
+    async def add_target(request: web.Request):
+        try:
+            body = await _json_object(request)
+            course = TargetCourse(
+                str(body.pop("course_id")),
+                int(body.pop("credit")),
+                bool(body.pop("use_wishlist", False)),
+            )
+            if body.get("index") is not None:
+                body["index"] = _index(body["index"], len(bot.target_courses))
+            if "bot_indexes" in body:
+                body["bot_indexes"] = [int(i) for i in body["bot_indexes"]]
+            bot.add_target(course, **body)
+        except (KeyError, TypeError, ValueError, json.JSONDecodeError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid target: {e}")
+        return ok()
+
+    @routes.delete("/targets/{course_id}")
+    async def remove_target(request: web.Request):
+        bot.remove_target(request.match_info["course_id"])
+        return ok()
+
+    @routes.post("/targets/{course_id}/priority")
+    async def reprioritize(request: web.Request):
+        try:
+            body = await _json_object(request)
+            index = _index(body["index"], max(len(bot.target_courses) - 1, 0))
+            bot.reprioritize(request.match_info["course_id"], index)
+        except (KeyError, TypeError, ValueError, json.JSONDecodeError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid priority: {e}")
+        return ok()
+
+    @routes.post("/pause")
+    async def pause(request: web.Request):
+        bot.pause()
+        return ok()
+
+    @routes.post("/resume")
+    async def resume(request: web.Request):
+        bot.resume()
+        return ok()
+
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+async def start_server(bot, host: str = "127.0.0.1", port: int = 8765, path: str = None):
+    """
+    Serve the control API of a bot. The bot keeps running when it has no targets left,
+    so new ones can be added later.
+
+    Args:
+        bot (Union[FcuCourseMaster, MutliAccountBot]): Bot to control.
+        host (str, optional): Host to bind. Defaults to "127.0.0.1".
+        port (int, optional): Port to bind. Defaults to 8765.
+        path (str, optional): Unix socket path, used instead of host and port if set. Defaults to None.
+
+    Returns:
+        web.AppRunner: Runner, call `await runner.cleanup()` to stop.
+    """
+    bot.exit_when_done = False
+
+    runner = web.AppRunner(_create_app(bot), access_log=None)
+    await runner.setup()
+
+    if path:
+        await web.UnixSite(runner, path).start()
+        logger.info("Serving control API at %s", path)
+    else:
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Serving control API at http://%s:%d", host, port)
+
+    return runner
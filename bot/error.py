@@ -3,6 +3,16 @@ class ServerException(Exception):
         super().__init__(message)
         self.should_exit = should_exit
 
+    def __reduce__(self):
+        # Keep should_exit when the exception crosses a process boundary.
+        return _restore, (self.__class__, str(self), self.should_exit)
+
+
+def _restore(cls, message, should_exit):
+    e = cls.__new__(cls)
+    ServerException.__init__(e, message, should_exit)
+    return e
+
 
 class LoginFailed(ServerException):
     def __init__(self, message, should_exit=False):
@@ -39,6 +49,11 @@ class CourseNotSelectabled(CourseException):
         super().__init__(message, True)
 
 
+class CourseConflict(CourseNotSelectabled):
+    def __init__(self, message):
+        super().__init__(message)
+
+
 class CreditNotEnough(CourseException):
     def __init__(self, message):
         super().__init__(message, True)
\ No newline at end of file
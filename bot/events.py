@@ -0,0 +1,135 @@
+"""
+Structured event log.
+
+Events are put on a queue as they are, with their timestamp. A QueueListener
+turns them into log records and JSON lines on a background thread, so emitting
+one costs a queue put on the event loop whatever the poll rate. Nothing is
+recorded until `start()` is called.
+
+    events.start("./events.jsonl")
+
+    {"ts": 1700000000.123, "event": "poll", "course_id": "1234", "quota": 60, "selected": 60, "cached": true}
+"""
+
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import NamedTuple, Optional
+
+_queue: queue.SimpleQueue = None
+_listener: QueueListener = None
+
+
+class Poll(NamedTuple):
+    kind = "poll"
+
+    course_id: str
+    quota: int
+    selected: int
+    cached: bool  # response was the same as the last one
+
+
+class SelectAttempt(NamedTuple):
+    kind = "select_attempt"
+
+    account: str
+    course_id: str
+    selected: bool
+    message: Optional[str]
+    wishlist: bool
+
+
+class StateChange(NamedTuple):
+    kind = "state_change"
+
+    account: str
+    field: str  # login, credit, selected_courses, paused
+    value: object
+
+
+class Error(NamedTuple):
+    kind = "error"
+
+    account: str
+    course_id: Optional[str]
+    error: str  # exception class name
+    message: str
+
+    @classmethod
+    def of(cls, account: str, e: Exception, course_id: str = None):
+        return cls(account, course_id, type(e).__name__, str(e))
+
+
+class JsonlFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord):
+        event = record.msg
+        return json.dumps(
+            {"ts": record.created, "event": event.kind, **event._asdict()},
+            ensure_ascii=False,
+            default=str,
+        )
+
+
+class _EventListener(QueueListener):
+    def prepare(self, item):
+        created, event = item
+        return logging.makeLogRecord(
+            {"name": __name__, "msg": event, "created": created, "levelno": logging.INFO, "levelname": "INFO"}
+        )
+
+
+def emit(event: NamedTuple):
+    """
+    Record an event, a no-op until `start()` is called.
+
+    Args:
+        event (NamedTuple): Poll, SelectAttempt, StateChange or Error.
+    """
+    if _queue is not None:
+        _queue.put((time.time(), event))
+
+
+def start(path: str = "./events.jsonl", max_bytes: int = 64 * 1024 * 1024, backup_count: int = 5):
+    """
+    Start writing events to a rotating JSONL file on a background thread.
+
+    Args:
+        path (str, optional): File path. Defaults to "./events.jsonl".
+        max_bytes (int, optional): Rotate when the file reaches this size. Defaults to 64 MiB.
+        backup_count (int, optional): Rotated files to keep. Defaults to 5.
+
+    Returns:
+        QueueListener: Listener, call `stop()` to flush and close.
+    """
+    global _queue, _listener
+
+    if _listener is not None:
+        return _listener
+
+    file_handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonlFormatter())
+
+    _queue = queue.SimpleQueue()
+    _listener = _EventListener(_queue, file_handler)
+    _listener.start()
+    return _listener
+
+
+def stop():
+    """
+    Write the queued events and close the file.
+    """
+    global _queue, _listener
+
+    if _listener is None:
+        return
+
+    _queue = None
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
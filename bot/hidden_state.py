@@ -0,0 +1,116 @@
+import hashlib
+import weakref
+from typing import Dict
+from urllib.parse import urlencode
+
+from . import metrics
+
+FIELDS = ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION")
+
+# digest -> state, so identical states, e.g. of the login page, are kept once
+_states: "weakref.WeakValueDictionary[bytes, HiddenState]" = weakref.WeakValueDictionary()
+
+STATES = metrics.registry.gauge("fcu_hidden_state_count", "Distinct ASP.NET hidden states held.")
+STATE_BYTES = metrics.registry.gauge("fcu_hidden_state_bytes", "Bytes of ASP.NET hidden state held.")
+
+
+class HiddenState:
+    __slots__ = ("raw", "encoded", "digest", "__weakref__")
+
+    def __init__(self, raw: tuple, encoded: bytes, digest: bytes):
+        """
+        ASP.NET hidden state of a page, immutable. Use `HiddenState.get` to create one.
+
+        Args:
+            raw (tuple): Raw bytes of each field in `FIELDS`.
+            encoded (bytes): The fields urlencoded, ready to be joined to a form body.
+            digest (bytes): Digest of `encoded`.
+        """
+        self.raw = raw
+        self.encoded = encoded
+        self.digest = digest
+
+    @classmethod
+    def get(cls, fields: Dict[str, str]):
+        """
+        Get the state of the fields, shared with every other holder of the same state.
+
+        Args:
+            fields (Dict[str, str]): ASP.NET state, see `parser.get_state`.
+
+        Returns:
+            HiddenState: Hidden state.
+        """
+        encoded = urlencode([(name, fields.get(name) or "") for name in FIELDS]).encode()
+        digest = hashlib.blake2b(encoded, digest_size=16).digest()
+
+        state = _states.get(digest)
+        if state is not None:
+            metrics.CACHE_TOTAL.inc(cache="hidden_state", result="hit")
+            return state
+
+        metrics.CACHE_TOTAL.inc(cache="hidden_state", result="miss")
+        state = _states[digest] = cls(
+            tuple((fields.get(name) or "").encode() for name in FIELDS), encoded, digest
+        )
+        return state
+
+    def __eq__(self, other):
+        return isinstance(other, HiddenState) and self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return f"<HiddenState {self.digest.hex()[:12]} {self.nbytes} bytes>"
+
+    @property
+    def nbytes(self):
+        return len(self.encoded) + sum(len(value) for value in self.raw)
+
+    def diff(self, other: "HiddenState"):
+        """
+        Args:
+            other (HiddenState): State to compare with, e.g. the previous one.
+
+        Returns:
+            List[str]: Names of the fields that differ.
+        """
+        if other is None:
+            return list(FIELDS)
+        if self.digest == other.digest:
+            return []
+        return [name for name, a, b in zip(FIELDS, self.raw, other.raw) if a != b]
+
+    def as_dict(self):
+        """
+        Returns:
+            Dict[str, str]: The fields as a plain dict, for debug dumps.
+        """
+        return {name: value.decode() for name, value in zip(FIELDS, self.raw)}
+
+
+def encode_form(payload: Dict[str, str], state: HiddenState = None):
+    """
+    Build a urlencoded form body, joining the pre-encoded state instead of copying it.
+
+    Args:
+        payload (Dict[str, str]): Form fields.
+        state (HiddenState, optional): Hidden state. Defaults to None.
+
+    Returns:
+        bytes: Form body.
+    """
+    body = urlencode(payload).encode()
+    if state is None:
+        return body
+    return body + b"&" + state.encoded if body else state.encoded
+
+
+def _collect():
+    states = list(_states.values())
+    STATES.set(len(states))
+    STATE_BYTES.set(sum(state.nbytes for state in states))
+
+
+metrics.registry.add_collector(_collect)
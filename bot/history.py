@@ -0,0 +1,236 @@
+"""
+Append-only quota history log.
+
+Every poll appends one fixed 16 byte record (course index, timestamp, quota,
+selected) to `{path}`, and every new course ID appends a line to
+`{path}.courses`, where line i is the course of index i. The log can be read
+back with `np.memmap` without parsing. Bots of one process writing to the same
+path share one writer, see `QuotaLog.shared`, so course indexes never clash.
+
+Analyse a log to tune `SearchOption.delay`:
+
+    python -m bot.history quota.log
+"""
+
+import argparse
+import os
+import struct
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+RECORD = np.dtype(
+    [("course", "<u4"), ("timestamp", "<f8"), ("quota", "<u2"), ("selected", "<u2")]
+)
+_RECORD_STRUCT = struct.Struct("<IdHH")
+
+assert RECORD.itemsize == _RECORD_STRUCT.size
+
+# absolute path -> writer shared in this process
+_shared: Dict[str, "QuotaLog"] = {}
+
+
+class QuotaLog:
+    def __init__(self, path: str):
+        """
+        Writer of a quota history log. Appends to an existing log.
+
+        Args:
+            path (str): Log path.
+        """
+        self.path = path
+        self.index: Dict[str, int] = {}
+        self.users = 1  # see `shared`
+
+        if os.path.exists(f"{path}.courses"):
+            with open(f"{path}.courses", encoding="utf-8") as f:
+                for i, course_id in enumerate(f.read().splitlines()):
+                    self.index[course_id] = i
+
+        # drop a partial record left by a crash, so records stay aligned
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % RECORD.itemsize:
+                os.truncate(path, size - size % RECORD.itemsize)
+
+        self.file = open(path, "ab", buffering=64 * 1024)
+        self.courses_file = open(f"{path}.courses", "a", encoding="utf-8")
+
+    @classmethod
+    def shared(cls, path: str):
+        """
+        Writer of a log shared by everyone in the process, each call must be paired with `close()`.
+
+        Args:
+            path (str): Log path.
+
+        Returns:
+            QuotaLog: Writer.
+        """
+        key = os.path.abspath(path)
+        log = _shared.get(key)
+        if log is None:
+            log = _shared[key] = cls(path)
+        else:
+            log.users += 1
+        return log
+
+    def write(self, course_id: str, quota: int, selected: int, timestamp: float = None):
+        """
+        Append a record.
+
+        Args:
+            course_id (str): Course ID.
+            quota (int): Quota.
+            selected (int): Selected count.
+            timestamp (float, optional): Unix time. Defaults to time.time().
+        """
+        i = self.index.get(course_id)
+        if i is None:
+            i = self.index[course_id] = len(self.index)
+            self.courses_file.write(f"{course_id}\n")
+            self.courses_file.flush()
+
+        self.file.write(
+            _RECORD_STRUCT.pack(
+                i, time.time() if timestamp is None else timestamp, quota, selected
+            )
+        )
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        """
+        Close the log, or only flush it while other users of a shared one are left.
+        """
+        self.users -= 1
+        if self.users > 0:
+            self.flush()
+            return
+
+        if _shared.get(os.path.abspath(self.path)) is self:
+            del _shared[os.path.abspath(self.path)]
+        self.file.close()
+        self.courses_file.close()
+
+
+def read(path: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Map a quota history log.
+
+    Args:
+        path (str): Log path.
+
+    Returns:
+        np.ndarray: Records, with fields course, timestamp, quota and selected.
+        List[str]: Course ID of each course index.
+    """
+    with open(f"{path}.courses", encoding="utf-8") as f:
+        course_ids = f.read().splitlines()
+
+    count = os.path.getsize(path) // RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, RECORD), course_ids
+
+    return np.memmap(path, RECORD, "r", shape=(count,)), course_ids
+
+
+def analyse(records: np.ndarray, course_ids: List[str]):
+    """
+    Seat release statistics per course.
+    A release is a sample with a free seat after a sample without one.
+
+    Args:
+        records (np.ndarray): Records, see `read`.
+        course_ids (List[str]): Course ID of each course index.
+
+    Returns:
+        List[dict]: Statistics of each course, `release_hours` counts releases per hour of the day in local time.
+    """
+    order = np.lexsort((records["timestamp"], records["course"]))
+    records = records[order]
+    starts = np.flatnonzero(np.diff(records["course"], prepend=-1))
+    ends = np.append(starts[1:], len(records))
+
+    stats = []
+    for start, end in zip(starts, ends):
+        r = records[start:end]
+        ts = r["timestamp"]
+        is_open = r["selected"] < r["quota"]
+
+        released = is_open[1:] & ~is_open[:-1]
+        closed = ~is_open[1:] & is_open[:-1]
+        release_times = ts[1:][released]
+        close_times = ts[1:][closed]
+
+        # how long each released seat stayed open, until the next full sample
+        next_close = np.searchsorted(close_times, release_times)
+        has_close = next_close < len(close_times)
+        open_durations = close_times[next_close[has_close]] - release_times[has_close]
+
+        intervals = np.diff(release_times)
+        poll_intervals = np.diff(ts)
+
+        stats.append(
+            {
+                "course_id": course_ids[r["course"][0]],
+                "samples": len(r),
+                "span": float(ts[-1] - ts[0]),
+                "poll_interval": float(np.median(poll_intervals)) if len(poll_intervals) else None,
+                "releases": int(released.sum()),
+                "open_ratio": float(is_open.mean()),
+                "release_interval_p50": float(np.median(intervals)) if len(intervals) else None,
+                "open_duration_p10": float(np.percentile(open_durations, 10)) if len(open_durations) else None,
+                "open_duration_p50": float(np.median(open_durations)) if len(open_durations) else None,
+                "release_hours": np.bincount(_local_hours(release_times), minlength=24).tolist(),
+            }
+        )
+
+    return stats
+
+
+def _local_hours(timestamps: np.ndarray):
+    """
+    Args:
+        timestamps (np.ndarray): Unix times.
+
+    Returns:
+        np.ndarray: Hour of the day of each, in local time.
+    """
+    offsets = np.fromiter(
+        (time.localtime(t).tm_gmtoff for t in timestamps.tolist()), np.float64, len(timestamps)
+    )
+    return ((timestamps + offsets) // 3600 % 24).astype(np.int64)
+
+
+def _format(value, unit="s"):
+    return "-" if value is None else f"{value:.2f}{unit}"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Seat release report of a quota history log.")
+    arg_parser.add_argument("path", help="quota history log")
+    args = arg_parser.parse_args()
+
+    records, course_ids = read(args.path)
+    print(f"{len(records)} samples of {len(course_ids)} courses")
+    print(
+        f"{'course':>8} {'samples':>8} {'poll':>8} {'releases':>8} {'open%':>6}"
+        f" {'release p50':>12} {'open p10':>9} {'open p50':>9} {'delay':>8}"
+    )
+
+    for s in analyse(records, course_ids):
+        # poll at least twice while a released seat is usually still open
+        delay = None if s["open_duration_p10"] is None else s["open_duration_p10"] / 2
+        print(
+            f"{s['course_id']:>8} {s['samples']:>8} {_format(s['poll_interval']):>8}"
+            f" {s['releases']:>8} {s['open_ratio'] * 100:>5.1f}%"
+            f" {_format(s['release_interval_p50']):>12} {_format(s['open_duration_p10']):>9}"
+            f" {_format(s['open_duration_p50']):>9} {_format(delay):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Event loop helpers: a loop-lag monitor and `run()`, which runs a coroutine
+under uvloop when it is installed (`pip install uvloop`).
+
+    from bot import loop
+
+    async def main():
+        bot = FcuCourseMaster(...)
+        await bot.start()
+
+    loop.run(main())
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Coroutine, Deque
+
+from . import metrics
+
+try:
+    import uvloop
+except ImportError:  # optional, only makes the loop faster
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = metrics.registry.histogram(
+    "fcu_event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, log_every: float = 10):
+        """
+        Sleep `interval` seconds in a loop and record how late each wake-up is. Lag means
+        something blocked the loop, e.g. parsing on the loop, debug file writes or cv2.
+
+        Args:
+            interval (float, optional): Seconds between samples. Defaults to 0.1.
+            threshold (float, optional): Lag in seconds worth a warning. Defaults to 0.1.
+            log_every (float, optional): Seconds between warnings, stalls in between are summed up. Defaults to 10.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.log_every = log_every
+        self.samples: Deque[float] = deque(maxlen=10000)
+        self.task: asyncio.Task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        return self
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stalls = 0
+        worst = 0.0
+        logged_at = loop.time()
+
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(now - expected, 0.0)
+
+            self.samples.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+            if lag > self.threshold:
+                stalls += 1
+                worst = max(worst, lag)
+
+            if stalls and now - logged_at >= self.log_every:
+                logger.warning(
+                    "Event loop blocked %d times in the last %.0fs, worst %.3fs.",
+                    stalls,
+                    now - logged_at,
+                    worst,
+                )
+                stalls = 0
+                worst = 0.0
+                logged_at = now
+
+    def percentiles(self, *q: float):
+        """
+        Args:
+            *q (float): Percentiles, 0 to 100.
+
+        Returns:
+            List[float]: Lag in seconds at each percentile of the recent samples.
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return [0.0 for _ in q]
+        return [samples[min(int(len(samples) * p / 100), len(samples) - 1)] for p in q]
+
+
+def use_loop(name: str = "auto"):
+    """
+    Set the event loop policy for loops created from now on.
+
+    Args:
+        name (str, optional): "asyncio", "uvloop" or "auto" (uvloop when installed). Defaults to "auto".
+
+    Returns:
+        str: Name of the loop in use.
+    """
+    if name == "uvloop" and uvloop is None:
+        raise ImportError("uvloop is not installed, run `pip install uvloop`.")
+
+    if name in ("uvloop", "auto") and uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return "uvloop"
+
+    asyncio.set_event_loop_policy(None)
+    return "asyncio"
+
+
+def run(main: Coroutine, loop: str = "auto", monitor: bool = True):
+    """
+    Run a coroutine in a new event loop, like `asyncio.run`. Create bots inside it,
+    so their sessions belong to that loop.
+
+    Args:
+        main (Coroutine): Coroutine to run.
+        loop (str, optional): "asyncio", "uvloop" or "auto" (uvloop when installed). Defaults to "auto".
+        monitor (bool, optional): Run a `LoopLagMonitor` alongside. Defaults to True.
+
+    Returns:
+        Any: Result of the coroutine.
+    """
+    name = use_loop(loop)
+    logger.info("Running on %s.", name)
+
+    async def wrapper():
+        lag_monitor = LoopLagMonitor().start() if monitor else None
+        try:
+            return await main
+        finally:
+            if lag_monitor:
+                lag_monitor.stop()
+
+    started = time.perf_counter()
+    try:
+        return asyncio.run(wrapper())
+    finally:
+        logger.debug("Loop ran for %.1fs.", time.perf_counter() - started)
@@ -0,0 +1,263 @@
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+
+def _escape(value: str):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra=""):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, registry: "Registry", name: str, documentation: str, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self.values.items()
+        ]
+
+    def render(self):
+        return "\n".join(
+            [
+                f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.type}",
+                *self.samples(),
+            ]
+        )
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """
+        Set the value directly, for collectors mirroring an external counter.
+        """
+        self.values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+
+        self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+
+        key = self._key(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+            self.sums[key] = 0.0
+
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    def samples(self):
+        lines = []
+        for key, counts in self.counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {total}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {self.sums[key]}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """
+        Collection of metrics. Every update is a no-op until `enabled` is set.
+        """
+        self.enabled = False
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: Metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """
+        Add a callback that refreshes metrics right before they are rendered.
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """
+        Render all metrics in Prometheus text format.
+
+        Returns:
+            str: Exposition text.
+        """
+        for collector in self.collectors:
+            collector()
+
+        return "\n".join(m.render() for m in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+OPERATION_SECONDS = registry.histogram(
+    "fcu_operation_duration_seconds", "Latency of bot operations.", ["operation"]
+)
+OPERATION_TOTAL = registry.counter(
+    "fcu_operation_total",
+    "Finished bot operations by result (success or exception class).",
+    ["operation", "result"],
+)
+POLLS_TOTAL = registry.counter("fcu_polls_total", "Course quota polls.")
+CACHE_TOTAL = registry.counter(
+    "fcu_cache_requests_total", "Cache lookups by result.", ["cache", "result"]
+)
+QUOTA_TO_SELECT_SECONDS = registry.histogram(
+    "fcu_quota_to_select_seconds",
+    "Time from quota detection to a successful selection.",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+
+
+def enable():
+    registry.enabled = True
+
+
+def timed(operation: str):
+    """
+    Record latency and result of an async function.
+
+    Args:
+        operation (str): Operation label.
+    """
+
+    def decorator(async_function):
+        @functools.wraps(async_function)
+        async def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return await async_function(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                result = await async_function(*args, **kwargs)
+            except BaseException as e:
+                OPERATION_TOTAL.inc(operation=operation, result=type(e).__name__)
+                raise
+            finally:
+                OPERATION_SECONDS.observe(
+                    time.perf_counter() - start, operation=operation
+                )
+
+            OPERATION_TOTAL.inc(operation=operation, result="success")
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def register_lru_cache(cache: str, cached_function):
+    """
+    Expose hits and misses of a functools.lru_cache wrapped function.
+
+    Args:
+        cache (str): Cache label.
+        cached_function: Function with `cache_info()`.
+    """
+
+    def collect():
+        info = cached_function.cache_info()
+        CACHE_TOTAL.set(info.hits, cache=cache, result="hit")
+        CACHE_TOTAL.set(info.misses, cache=cache, result="miss")
+
+    registry.add_collector(collect)
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 9464):
+    """
+    Enable metrics and serve them at http://{host}:{port}/metrics.
+
+    Args:
+        host (str, optional): Host to bind. Defaults to "127.0.0.1".
+        port (int, optional): Port to bind. Defaults to 9464.
+
+    Returns:
+        web.AppRunner: Runner, call `await runner.cleanup()` to stop.
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(
+            body=registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    enable()
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    logger.info("Serving metrics at http://%s:%d/metrics", host, port)
+    return runner
@@ -1,6 +1,7 @@
 from datetime import datetime
 from aiohttp import ClientSession
 
+from . import metrics
 from .search import CourseData
 
 
@@ -101,8 +102,12 @@ class LineNotification:
 
 
 class Notification:
-    def __init__(self, username: str, webhook: str):
-        self.session = ClientSession()
+    def __init__(self, username: str, webhook: str, session: ClientSession = None):
+        # a shared session is closed by its owner, see `resources.Resources`
+        self.owns_session = session is None
+        self.session = session
+        if self.session is None and webhook is not None:
+            self.session = ClientSession()
         self.username = username
         self.webhook = webhook
         self.handler = (
@@ -113,11 +118,26 @@ class Notification:
             else LineNotification(self.session, self.webhook)
         )
 
+    @metrics.timed("notify_select")
     async def select_successful(self, course_data: CourseData, max_credit: int, current_credit: int):
+        if self.handler is None:
+            return
+
         await self.handler.select_successful(self.username, course_data, max_credit, current_credit)
 
+    @metrics.timed("notify_error")
     async def error(self, message: str):
+        if self.handler is None:
+            return
+
         await self.handler.error(self.username, message)
 
+    async def close(self):
+        if self.owns_session and self.session is not None:
+            await self.session.close()
+
     async def stoped(self, message: str):
+        if self.handler is None:
+            return
+
         await self.handler.error(self.username, message)
\ No newline at end of file
@@ -1,11 +1,15 @@
-from typing import Dict, NamedTuple
-
-from bs4 import BeautifulSoup
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
 
+from .error import ServerException
 from .search import SearchOption, get_course_id
+from .utils import check_response
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 
-def get_state(soup: BeautifulSoup):
+def get_state(soup: "BeautifulSoup"):
     """
     Parse ASP.NET state.
 
@@ -31,25 +35,67 @@ class WishlistButtonState(NamedTuple):
     remove_event: str
 
 
-async def get_user_state(search_option: SearchOption, soup: BeautifulSoup):
+class ParsedPage(NamedTuple):
+    """
+    Everything the bot needs from a response page, as plain picklable data.
+    """
+
+    error: Optional[ServerException] = None
+    state: dict = {}
+    service_path: str = None
+    wishlisted_courses: Dict[str, str] = {}
+    wishlisted_course_state: Dict[str, WishlistButtonState] = {}
+    timetable: List[Tuple[str, int, int]] = []  # (course_name, week, period)
+    max_credit: int = None
+    current_credit: int = None
+    captcha_required: bool = False
+    message: Optional[str] = None
+    can_add_searched: bool = False
+    search_result_button: Optional[str] = None
+
+    def raise_for_error(self):
+        if self.error is not None:
+            raise self.error
+
+
+def parse_state_page(html: str):
     """
-    Parse user state.
+    Parse a page that only carries ASP.NET state, e.g. the login page.
 
     Args:
-        soup (BeautifulSoup): Response soup.
+        html (str): Response HTML.
 
     Returns:
-        str: ASP.NET form path.
-        Dict[str, str]: Selected courses.
-        Dict[str, str]: Wishlisted courses.
-        Dict[str, WishlistButtonState]: State of wishlisted courses.
-        int: Max credits.
-        int: Current credits.
+        ParsedPage: Parsed page with only `state` filled.
     """
-    service_path = soup.select_one("#aspnetForm").get("action")
-    selected_courses: Dict[str, str] = {}
+    from bs4 import BeautifulSoup
+
+    return ParsedPage(state=get_state(BeautifulSoup(html, "html.parser")))
+
+
+def parse_page(html: str):
+    """
+    Parse and extract a service page.
+    It is a pure function, so it can run in a thread or process pool.
+
+    Args:
+        html (str): Response HTML.
+
+    Returns:
+        ParsedPage: Parsed page. `error` is set instead of raising.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    try:
+        check_response(soup)
+    except ServerException as e:
+        return ParsedPage(error=e)
+
     wishlisted_courses: Dict[str, str] = {}
     wishlisted_course_state: Dict[str, WishlistButtonState] = {}
+    timetable: List[Tuple[str, int, int]] = []
 
     for tr in soup.select("#ctl00_MainContent_TabContainer1_tabSelected_gvWishList tr"):
         course_id_td = tr.select_one("td.gvAddWithdrawCellOne")
@@ -85,10 +131,7 @@ async def get_user_state(search_option: SearchOption, soup: BeautifulSoup):
             course_name = td.text.strip()
 
             if course_name:
-                course_id = await get_course_id(
-                    search_option, course_name, week, period
-                )
-                selected_courses.update({course_id: course_name})
+                timetable.append((course_name, week, period))
 
     max_credit = int(soup.select_one("#ctl00_userInfo1_lblCreditUpperBound").text)
     current_credit = int(
@@ -97,11 +140,82 @@ async def get_user_state(search_option: SearchOption, soup: BeautifulSoup):
         ]
     )
 
-    return (
-        service_path,
-        selected_courses,
-        wishlisted_courses,
-        wishlisted_course_state,
-        max_credit,
-        current_credit,
+    # TODO: Make sure the queryselector is correct.
+    # Maybe we can keep cached captcha in payload to avoid this?
+    captcha_required = soup.select_one(
+        "#ctl00_MainContent_TabContainer1_tabSelected_CAPTCHA_imgCAPTCHA"
+    )
+    # ctl00$MainContent$TabContainer1$tabSelected$CAPTCHA$tbCAPTCHA
+
+    msg_span = soup.select_one(
+        "#ctl00_MainContent_TabContainer1_tabSelected_lblMsgBlock"
     )
+    search_result_btn = soup.select_one(
+        "#ctl00_MainContent_TabContainer1_tabCourseSearch_wcCourseSearch_gvSearchResult input[value='關注']"
+    )
+
+    return ParsedPage(
+        state=get_state(soup),
+        service_path=soup.select_one("#aspnetForm").get("action"),
+        wishlisted_courses=wishlisted_courses,
+        wishlisted_course_state=wishlisted_course_state,
+        timetable=timetable,
+        max_credit=max_credit,
+        current_credit=current_credit,
+        captcha_required=bool(captcha_required),
+        message=msg_span.text.strip() if msg_span else None,
+        can_add_searched=bool(
+            soup.select_one(
+                "#ctl00_MainContent_TabContainer1_tabSelected_gvToAdd input[value='加選']"
+            )
+        ),
+        search_result_button=search_result_btn.get("name")
+        if search_result_btn
+        else None,
+    )
+
+
+async def get_selected_courses(
+    search_option: SearchOption, timetable: List[Tuple[str, int, int]]
+):
+    """
+    Resolve course IDs of the timetable cells.
+
+    Args:
+        search_option (SearchOption): Search option.
+        timetable (List[Tuple[str, int, int]]): (course_name, week, period) of each cell.
+
+    Returns:
+        Dict[str, str]: Selected courses.
+    """
+    selected_courses: Dict[str, str] = {}
+
+    for course_name, week, period in timetable:
+        course_id = await get_course_id(search_option, course_name, week, period)
+        selected_courses.update({course_id: course_name})
+
+    return selected_courses
+
+
+_executors: Dict[str, Executor] = {}
+
+
+def get_executor(kind: str):
+    """
+    Get a parse executor shared by every bot in this process.
+
+    Args:
+        kind (str): "thread" or "process".
+
+    Returns:
+        Executor: Shared executor.
+    """
+    if kind not in _executors:
+        if kind == "thread":
+            _executors[kind] = ThreadPoolExecutor(thread_name_prefix="parser")
+        elif kind == "process":
+            _executors[kind] = ProcessPoolExecutor()
+        else:
+            raise ValueError(f"Unknown parse executor: {kind}")
+
+    return _executors[kind]
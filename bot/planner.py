@@ -0,0 +1,217 @@
+"""
+Target planner: which target courses can still be taken.
+
+Targets are kept in priority order and indexed by the timetable slots they
+use and by credit. When the timetable or the credit left changes, only the
+courses on the changed slots or in the crossed credit range are checked
+again, so a keep-alive that changes nothing costs nothing. A course that can
+not be taken now is blocked, not dropped, and comes back if the clash or
+credit shortage goes away, e.g. when a course is withdrawn on the site.
+"""
+
+import math
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .error import CourseConflict, CreditNotEnough
+
+if TYPE_CHECKING:
+    from . import TargetCourse
+
+Blocked = Tuple["TargetCourse", Exception]
+
+
+class Planner:
+    def __init__(
+        self,
+        check: Callable[["TargetCourse"], None],
+        targets: Iterable["TargetCourse"] = (),
+    ):
+        """
+        Args:
+            check (Callable[[TargetCourse], None]): Raises CourseConflict or CreditNotEnough if a course can not be taken, e.g. `FcuCourseMaster.check_course`.
+            targets (Iterable[TargetCourse], optional): Target courses in priority order. Defaults to ().
+        """
+        self.check = check
+        self.targets: List["TargetCourse"] = []  # priority order, blocked ones included
+        self.blocked: Dict[str, Exception] = {}  # course_id -> why it can not be taken now
+
+        self._by_id: Dict[str, "TargetCourse"] = {}
+        self._slots: Dict[str, int] = {}  # course_id -> indexed slots, once known
+        self._by_slot: Dict[int, Set[str]] = {}  # bit index -> course IDs
+        self._by_credit: Dict[int, Set[str]] = {}  # credit -> course IDs
+        self._occupied = 0
+        self._credit_left = math.inf
+        self._feasible: Optional[List["TargetCourse"]] = None
+
+        for course in targets:
+            self.add(course)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __iter__(self):
+        return iter(self.targets)
+
+    def __contains__(self, course_id: str):
+        return course_id in self._by_id
+
+    def get(self, course_id: str):
+        return self._by_id.get(course_id)
+
+    def is_feasible(self, course_id: str):
+        return course_id in self._by_id and course_id not in self.blocked
+
+    def feasible(self):
+        """
+        Returns:
+            List[TargetCourse]: Courses that can be taken now, in priority order. Do not modify it.
+        """
+        if self._feasible is None:
+            self._feasible = [c for c in self.targets if c.course_id not in self.blocked]
+        return self._feasible
+
+    def add(self, course: "TargetCourse", index: int = None):
+        """
+        Args:
+            course (TargetCourse): Target course, ignored if already planned.
+            index (int, optional): Position in priority order. Defaults to None (last).
+
+        Returns:
+            Optional[Exception]: Why the course is blocked, None if it can be taken.
+        """
+        if course.course_id in self._by_id:
+            return self.blocked.get(course.course_id)
+
+        self.targets.insert(len(self.targets) if index is None else index, course)
+        self._by_id[course.course_id] = course
+        self._by_credit.setdefault(course.credit, set()).add(course.course_id)
+        if course.slots is not None:
+            self._index_slots(course)
+        self._feasible = None
+
+        blocked, _ = self._evaluate([course.course_id])
+        return blocked[0][1] if blocked else None
+
+    def remove(self, course_id: str):
+        """
+        Args:
+            course_id (str): Course ID, e.g. of a selected course.
+
+        Returns:
+            Optional[TargetCourse]: The removed course, None if it was not planned.
+        """
+        course = self._by_id.pop(course_id, None)
+        if course is None:
+            return None
+
+        self.targets.remove(course)
+        self.blocked.pop(course_id, None)
+        self._by_credit[course.credit].discard(course_id)
+        for bit in _bits(self._slots.pop(course_id, 0)):
+            self._by_slot[bit].discard(course_id)
+        self._feasible = None
+        return course
+
+    def move(self, course_id: str, index: int):
+        """
+        Args:
+            course_id (str): Course ID.
+            index (int): New position, 0 is first.
+
+        Returns:
+            bool: False if the course is not planned.
+        """
+        course = self._by_id.get(course_id)
+        if course is None:
+            return False
+
+        self.targets.remove(course)
+        self.targets.insert(index, course)
+        self._feasible = None
+        return True
+
+    def clear(self):
+        for course_id in list(self._by_id):
+            self.remove(course_id)
+
+    def learn_slots(self, course: "TargetCourse", slots: int):
+        """
+        Set the timetable of a course from its first poll and check it.
+
+        Args:
+            course (TargetCourse): Target course.
+            slots (int): Timetable bitmap, see `search.CourseData.slots`.
+
+        Returns:
+            Optional[Exception]: Why the course is blocked, None if it can be taken.
+        """
+        if course.slots is None:
+            course.slots = slots
+
+        if course.course_id in self._by_id and course.course_id not in self._slots:
+            self._index_slots(course)
+            self._evaluate([course.course_id])
+
+        return self.blocked.get(course.course_id)
+
+    def update(self, occupied: int, credit_left: int) -> Tuple[List[Blocked], List["TargetCourse"]]:
+        """
+        Check again the courses affected by a timetable or credit change.
+
+        Args:
+            occupied (int): Timetable bitmap of selected courses.
+            credit_left (int): Max credit minus current credit.
+
+        Returns:
+            List[Tuple[TargetCourse, Exception]]: Newly blocked courses and why.
+            List[TargetCourse]: Courses that can be taken again.
+        """
+        course_ids: Set[str] = set()
+
+        for bit in _bits(occupied ^ self._occupied):
+            course_ids |= self._by_slot.get(bit, set())
+
+        low, high = sorted((credit_left, self._credit_left))
+        if low != high:
+            for credit, ids in self._by_credit.items():
+                if low < credit <= high:
+                    course_ids |= ids
+
+        self._occupied = occupied
+        self._credit_left = credit_left
+        return self._evaluate(course_ids)
+
+    def _index_slots(self, course: "TargetCourse"):
+        self._slots[course.course_id] = course.slots or 0
+        for bit in _bits(course.slots or 0):
+            self._by_slot.setdefault(bit, set()).add(course.course_id)
+
+    def _evaluate(self, course_ids: Iterable[str]):
+        blocked: List[Blocked] = []
+        unblocked: List["TargetCourse"] = []
+
+        for course_id in course_ids:
+            course = self._by_id[course_id]
+            try:
+                self.check(course)
+
+            except (CourseConflict, CreditNotEnough) as e:
+                if course_id not in self.blocked:
+                    blocked.append((course, e))
+                self.blocked[course_id] = e
+                continue
+
+            if self.blocked.pop(course_id, None) is not None:
+                unblocked.append(course)
+
+        if blocked or unblocked:
+            self._feasible = None
+
+        return blocked, unblocked
+
+
+def _bits(bitmap: int):
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
@@ -0,0 +1,150 @@
+"""
+Polling strategies, deciding which target courses are polled on each tick and
+how long to wait before the next one. `FcuCourseMaster` and `MutliAccountBot`
+use `FixedDelay(search_option.delay)` unless given another strategy.
+
+Compare them offline with `python -m benchmarks.polling`.
+"""
+
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    from .quota import QuotaTable
+
+
+class PollingStrategy(ABC):
+    # typeOptions of a coursesearch query sent once before every tick, see `search.search_courses`
+    batch: dict = None
+
+    def due(self, course_ids: List[str], table: "QuotaTable", now: float):
+        """
+        Args:
+            course_ids (List[str]): Target course IDs, by priority.
+            table (QuotaTable): Quota table, already updated by the batch query if any.
+            now (float): Timestamp.
+
+        Returns:
+            List[str]: Course IDs to poll on this tick.
+        """
+        return course_ids
+
+    def observe_batch(self, course_ids: List[str], now: float):
+        """
+        Called with the courses returned by every batch query.
+
+        Args:
+            course_ids (List[str]): Course IDs.
+            now (float): Timestamp.
+        """
+
+    def observe(self, course_id: str, quota: int, selected: int, now: float):
+        """
+        Called with the result of every poll.
+
+        Args:
+            course_id (str): Course ID.
+            quota (int): Quota.
+            selected (int): Selected count.
+            now (float): Timestamp.
+        """
+
+    @abstractmethod
+    def delay(self, now: float):
+        """
+        Args:
+            now (float): Timestamp after the tick.
+
+        Returns:
+            float: Seconds to wait before the next tick.
+        """
+
+
+class FixedDelay(PollingStrategy):
+    def __init__(self, delay: float):
+        """
+        Poll every target course, then wait a fixed delay.
+
+        Args:
+            delay (float): Seconds between ticks.
+        """
+        self._delay = delay
+
+    def delay(self, now: float):
+        return self._delay
+
+
+class Adaptive(PollingStrategy):
+    def __init__(self, min_delay: float, max_delay: float, backoff: float = 1.5, rate: float = None):
+        """
+        Poll each course on its own interval, which drops to `min_delay` when the course
+        changes or has a free seat, and grows by `backoff` up to `max_delay` while it stays
+        unchanged. Seats are usually released in bursts, so recently active courses are
+        polled more often.
+
+        Args:
+            min_delay (float): Shortest interval of a course.
+            max_delay (float): Longest interval of a course.
+            backoff (float, optional): Interval growth per unchanged poll. Defaults to 1.5.
+            rate (float, optional): Upper bound of polls per second. Defaults to None (unbounded).
+        """
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.rate = rate
+
+        self.interval: Dict[str, float] = {}
+        self.next_at: Dict[str, float] = {}
+        self.last: Dict[str, tuple] = {}
+        self.polled = 0
+
+    def due(self, course_ids: List[str], table: "QuotaTable", now: float):
+        for course_id in set(self.next_at) - set(course_ids):
+            del self.next_at[course_id]
+
+        due = [c for c in course_ids if self.next_at.get(c, now) <= now]
+        self.polled = len(due)
+        return due
+
+    def observe(self, course_id: str, quota: int, selected: int, now: float):
+        last = self.last.get(course_id)
+        self.last[course_id] = (quota, selected)
+
+        if last is None or last != (quota, selected) or selected < quota:
+            interval = self.min_delay
+        else:
+            interval = min(self.interval[course_id] * self.backoff, self.max_delay)
+
+        self.interval[course_id] = interval
+        self.next_at[course_id] = now + interval
+
+    def delay(self, now: float):
+        delay = max(min(self.next_at.values(), default=now + self.min_delay) - now, 0)
+        if self.rate:
+            delay = max(delay, self.polled / self.rate)
+        return delay
+
+
+class Batched(PollingStrategy):
+    def __init__(self, delay: float, type_options: dict):
+        """
+        Watch every course with one coursesearch query per tick, e.g. a whole department,
+        and only poll the target courses it shows with a free seat, or does not cover.
+
+        Args:
+            delay (float): Seconds between ticks.
+            type_options (dict): typeOptions of the query, see `search.search_courses`.
+        """
+        self._delay = delay
+        self.batch = type_options
+        self.covered = set()
+
+    def observe_batch(self, course_ids: List[str], now: float):
+        self.covered = set(course_ids)
+
+    def due(self, course_ids: List[str], table: "QuotaTable", now: float):
+        is_open = table.is_open(course_ids)
+        return [c for c, o in zip(course_ids, is_open.tolist()) if o or c not in self.covered]
+
+    def delay(self, now: float):
+        return self._delay
@@ -0,0 +1,182 @@
+import cProfile
+import logging
+import os
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+_profiler: "Profiler" = None  # process-wide, see `create_profiler`
+
+
+class Profiler:
+    def __init__(self, path: str, interval: float = 300):
+        """
+        cProfile based profiler keeping a separate profile per phase.
+        Phases are exclusive, entering a nested phase pauses the outer one.
+
+        cProfile records whatever runs on the thread, so a phase must not
+        span an `await`, or it is charged with every other task run meanwhile.
+        Phases only wrap synchronous work: parse, decode, build and verify_code.
+        Work in a parse executor is not profiled.
+
+        Profiles are written to `{path}/{phase}.prof`, and every `interval` seconds
+        a snapshot is also written to `{path}/{phase}-{n}.prof`.
+        Open them with `python -m pstats` or snakeviz.
+
+        Args:
+            path (str): Output directory.
+            interval (float, optional): Seconds between snapshots. Defaults to 300.
+        """
+        self.path = path
+        self.interval = interval
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.stack: List[cProfile.Profile] = []
+        self.snapshot_count = 0
+        self.last_snapshot = time.monotonic()
+
+        os.makedirs(path, exist_ok=True)
+
+    def phase(self, name: str):
+        """
+        Profile the code inside.
+
+        Args:
+            name (str): Phase name, e.g. "login", "poll", "select", "parse".
+
+        Returns:
+            ContextManager: Context manager.
+        """
+        return _Phase(self, name)
+
+    def _enter(self, name: str):
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.profiles[name] = cProfile.Profile()
+
+        if self.stack:
+            self.stack[-1].disable()
+
+        self.stack.append(profile)
+        profile.enable()
+        return profile
+
+    def _exit(self, profile: cProfile.Profile):
+        # Only the top of the stack is enabled. Tasks may leave phases out of
+        # order, a paused one is just removed wherever it is.
+        if self.stack[-1] is profile:
+            self.stack.pop().disable()
+            if self.stack:
+                self.stack[-1].enable()
+
+        else:
+            for i in range(len(self.stack) - 2, -1, -1):
+                if self.stack[i] is profile:
+                    del self.stack[i]
+                    break
+
+        if not self.stack and time.monotonic() - self.last_snapshot >= self.interval:
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Write every phase profile and a numbered copy.
+        Only runs while no phase is active, since dumping stops the profile.
+        """
+        if self.stack:
+            return
+
+        self.snapshot_count += 1
+        self.last_snapshot = time.monotonic()
+
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.path, f"{name}.prof"))
+            profile.dump_stats(
+                os.path.join(self.path, f"{name}-{self.snapshot_count:04d}.prof")
+            )
+
+        logger.info(
+            "[Profile] Snapshot %d written to %s", self.snapshot_count, self.path
+        )
+
+    def dump(self):
+        """
+        Write every phase profile.
+        """
+        if self.stack:
+            return
+
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.path, f"{name}.prof"))
+
+
+class _Phase:
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.profiles = []
+
+    def __enter__(self):
+        self.profiles.append(self.profiler._enter(self.name))
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self.profiles.pop())
+
+
+class NullProfiler:
+    """
+    Profiler that does nothing, used when profiling is off.
+    """
+
+    def phase(self, name: str):
+        return nullcontext()
+
+    def snapshot(self):
+        pass
+
+    def dump(self):
+        pass
+
+
+def phase(name: str):
+    """
+    Profile the code inside with the process profiler, if any bot created one.
+
+    Args:
+        name (str): Phase name.
+
+    Returns:
+        ContextManager: Context manager.
+    """
+    return _profiler.phase(name) if _profiler is not None else nullcontext()
+
+
+def create_profiler(profile: str = None, interval: float = 300):
+    """
+    Only one cProfile profile can be enabled at a time (Python 3.12 raises
+    otherwise), so every bot in the process shares one Profiler, the first
+    one created. Its phases are exclusive across bots too.
+
+    Args:
+        profile (str, optional): Output directory, profiling is off if None. Defaults to None.
+        interval (float, optional): Seconds between snapshots. Defaults to 300.
+
+    Returns:
+        Union[Profiler, NullProfiler]: Profiler.
+    """
+    global _profiler
+
+    if not profile:
+        return NullProfiler()
+
+    if _profiler is None:
+        _profiler = Profiler(profile, interval)
+
+    elif os.path.abspath(profile) != os.path.abspath(_profiler.path):
+        logger.warning(
+            "[Profile] Already profiling to %s, %s is ignored.", _profiler.path, profile
+        )
+
+    return _profiler
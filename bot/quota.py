@@ -0,0 +1,168 @@
+import time
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+class QuotaTable:
+    def __init__(self, capacity: int = 64):
+        """
+        Columnar quota state of watched courses, updated in place on every poll.
+        Row i belongs to `course_ids[i]`.
+
+        Args:
+            capacity (int, optional): Initial number of rows, grows when needed. Defaults to 64.
+        """
+        self.index: Dict[str, int] = {}
+        self.course_ids: List[str] = []
+        self.quota = np.zeros(capacity, np.int32)  # scr_precnt
+        self.selected = np.zeros(capacity, np.int32)  # scr_acptcnt
+        self.changed_at = np.zeros(capacity, np.float64)
+        self.prev_remain = np.zeros(capacity, np.int32)  # free seats before the last update
+
+    def __len__(self):
+        return len(self.course_ids)
+
+    def __contains__(self, course_id: str):
+        return course_id in self.index
+
+    def row(self, course_id: str):
+        """
+        Get the row of a course, adding it if it is new.
+
+        Args:
+            course_id (str): Course ID.
+
+        Returns:
+            int: Row index.
+        """
+        i = self.index.get(course_id)
+        if i is not None:
+            return i
+
+        i = len(self.course_ids)
+        if i == len(self.quota):
+            for name in ("quota", "selected", "changed_at", "prev_remain"):
+                column = getattr(self, name)
+                setattr(self, name, np.concatenate([column, np.zeros_like(column)]))
+
+        self.index[course_id] = i
+        self.course_ids.append(course_id)
+        return i
+
+    def update(self, course_id: str, quota: int, selected: int, now: float = None):
+        """
+        Update one course.
+
+        Args:
+            course_id (str): Course ID.
+            quota (int): Quota.
+            selected (int): Selected count.
+            now (float, optional): Timestamp. Defaults to time.time().
+
+        Returns:
+            bool: True if the course has a free seat.
+        """
+        i = self.row(course_id)
+        self.prev_remain[i] = self.quota[i] - self.selected[i]
+        if self.quota[i] != quota or self.selected[i] != selected:
+            self.quota[i] = quota
+            self.selected[i] = selected
+            self.changed_at[i] = time.time() if now is None else now
+        return selected < quota
+
+    def update_many(self, course_ids: Iterable[str], quota, selected, now: float = None):
+        """
+        Update many courses at once.
+
+        Args:
+            course_ids (Iterable[str]): Course IDs.
+            quota (ArrayLike): Quota of each course.
+            selected (ArrayLike): Selected count of each course.
+            now (float, optional): Timestamp. Defaults to time.time().
+        """
+        rows = np.fromiter((self.row(c) for c in course_ids), np.intp)
+        quota = np.asarray(quota, np.int32)
+        selected = np.asarray(selected, np.int32)
+
+        self.prev_remain[rows] = self.quota[rows] - self.selected[rows]
+        changed = (self.quota[rows] != quota) | (self.selected[rows] != selected)
+        self.changed_at[rows[changed]] = time.time() if now is None else now
+        self.quota[rows] = quota
+        self.selected[rows] = selected
+
+    def ingest(self, items: List[dict], now: float = None):
+        """
+        Update from raw coursesearch items, e.g. the result of a department-wide query.
+
+        Args:
+            items (List[dict]): Items of a GetType2Result response.
+            now (float, optional): Timestamp. Defaults to time.time().
+        """
+        self.update_many(
+            [item["scr_selcode"] for item in items],
+            [item["scr_precnt"] for item in items],
+            [item["scr_acptcnt"] for item in items],
+            now,
+        )
+
+    def open_mask(self):
+        """
+        Returns:
+            np.ndarray: True for each row with a free seat.
+        """
+        n = len(self.course_ids)
+        return self.selected[:n] < self.quota[:n]
+
+    def is_open(self, course_ids: List[str]):
+        """
+        Look up many courses at once, e.g. the targets after a department-wide query.
+
+        Args:
+            course_ids (List[str]): Course IDs.
+
+        Returns:
+            np.ndarray: True for each course with a free seat, False if it is not in the table.
+        """
+        return self._lookup(self.open_mask(), course_ids)
+
+    def openings(self, course_ids: List[str] = None):
+        """
+        Courses that gained a free seat on their last update, full before and free now,
+        with one vectorized comparison. A course seen for the first time counts as full before.
+
+        Args:
+            course_ids (List[str], optional): Only check these courses, in this order. Defaults to None (every course).
+
+        Returns:
+            List[str]: Course IDs.
+        """
+        n = len(self.course_ids)
+        opened = (self.prev_remain[:n] <= 0) & (self.quota[:n] - self.selected[:n] > 0)
+
+        if course_ids is None:
+            return [self.course_ids[i] for i in np.flatnonzero(opened)]
+
+        return [c for c, o in zip(course_ids, self._lookup(opened, course_ids).tolist()) if o]
+
+    def _lookup(self, column: np.ndarray, course_ids: List[str]):
+        # values of a boolean column for many courses, False for unknown ones
+        rows = np.fromiter((self.index.get(c, -1) for c in course_ids), np.intp, len(course_ids))
+        known = rows >= 0
+        values = np.zeros(len(course_ids), np.bool_)
+        values[known] = column[rows[known]]
+        return values
+
+    def as_dict(self):
+        """
+        Returns:
+            Dict[str, dict]: JSON serializable state of each course.
+        """
+        return {
+            course_id: {
+                "quota": int(self.quota[i]),
+                "selected": int(self.selected[i]),
+                "changed_at": float(self.changed_at[i]),
+            }
+            for course_id, i in self.index.items()
+        }
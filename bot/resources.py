@@ -0,0 +1,94 @@
+"""
+Resources shared between bots in one process.
+
+By default every FcuCourseMaster opens a ClientSession for the course site
+and its Notification another, so N accounts hold 2N connection pools. Bots
+created with `resources=` share one TCPConnector instead: one pool, one DNS
+cache, with the search client on it too. Every account keeps its own session,
+so cookies stay isolated. Notifications share one cookieless session.
+
+    async with Resources() as resources:
+        async with FcuCourseMaster(..., resources=resources) as bot:
+            await bot.start()
+
+Closing is in order: bots close their own sessions, then `Resources.close()`
+closes the notification and search sessions and finally the connector, which
+closes every pooled socket.
+"""
+
+import asyncio
+import logging
+
+from aiohttp import ClientSession, DummyCookieJar, TCPConnector
+
+from . import search
+
+logger = logging.getLogger(__name__)
+
+
+class Resources:
+    def __init__(self, limit: int = 0, limit_per_host: int = 0, ttl_dns_cache: int = 300):
+        """
+        Create it inside the event loop that runs the bots.
+
+        Args:
+            limit (int, optional): Connections in the shared pool, 0 for no limit. Defaults to 0.
+            limit_per_host (int, optional): Connections per host, 0 for no limit. Defaults to 0.
+            ttl_dns_cache (int, optional): Seconds to cache DNS lookups for. Defaults to 300.
+        """
+        self.connector = TCPConnector(
+            limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=ttl_dns_cache
+        )
+        self._notification_session: ClientSession = None
+        self.closed = False
+
+        search.use_connector(self.connector)
+
+    def session(self, **kwargs):
+        """
+        Create a session on the shared connector, with its own cookie jar. The caller closes it.
+
+        Args:
+            **kwargs: Extra ClientSession arguments, e.g. headers or trace_configs.
+
+        Returns:
+            ClientSession: Client session.
+        """
+        if self.closed:
+            raise RuntimeError("Resources are closed.")
+
+        return ClientSession(connector=self.connector, connector_owner=False, **kwargs)
+
+    def notification_session(self):
+        """
+        Returns:
+            ClientSession: Session for notification webhooks, shared and closed by `close()`.
+        """
+        if self._notification_session is None:
+            self._notification_session = self.session(cookie_jar=DummyCookieJar())
+
+        return self._notification_session
+
+    async def close(self):
+        """
+        Close the shared sessions and the connector. Close the bots first.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        if self._notification_session is not None:
+            await self._notification_session.close()
+        await search.close()
+        search.use_connector(None)
+        await self.connector.close()
+
+        # let transports finish closing, so no socket outlives the loop
+        await asyncio.sleep(0)
+        logger.debug("Shared resources closed.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -2,20 +2,105 @@ import json
 import logging
 from datetime import datetime
 from enum import Enum
-from functools import cache
-from typing import NamedTuple
+from functools import cache, lru_cache
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Tuple
 
-from aiohttp import ClientTimeout, request
+from aiohttp import BaseConnector, ClientSession, ClientTimeout, TraceConfig
 
+from . import events, metrics, profiling, shadow, timetable, tracing
 from .error import CourseNotFound
 from .utils import async_lru_cache
 
+if TYPE_CHECKING:
+    from .quota import QuotaTable
+
+try:
+    import orjson
+except ImportError:  # optional, only makes decoding faster
+    orjson = None
+
 COURSE_SEARCH_URL = (
     "https://coursesearch01.fcu.edu.tw/Service/Search.asmx/GetType2Result"
 )
 
 logger = logging.getLogger(__name__)
 
+loads = orjson.loads if orjson else json.loads
+
+_session: ClientSession = None
+_connector: BaseConnector = None  # shared one, see `resources.Resources`
+_users = 0  # bots using the search client, see `acquire`
+trace_configs: List[TraceConfig] = []
+
+
+def get_session():
+    """
+    Get the search client session, shared so connections to coursesearch are reused.
+    `trace_configs` must be filled before the first request.
+
+    Returns:
+        ClientSession: Search client session.
+    """
+    global _session
+
+    if _session is None or _session.closed:
+        _session = ClientSession(
+            connector=_connector,
+            connector_owner=_connector is None,
+            trace_configs=trace_configs or None,
+        )
+
+    return _session
+
+
+def use_connector(connector: BaseConnector = None):
+    """
+    Put the search client on a shared connector, or back on its own with None.
+    Takes effect on the next session, so call it before the first request or after `close()`.
+
+    Args:
+        connector (BaseConnector, optional): Connector. Defaults to None.
+    """
+    global _connector
+    _connector = connector
+
+
+def enable_tracing():
+    """
+    Trace requests of the search client, see `tracing.create_trace_config`.
+    """
+    if not trace_configs:
+        trace_configs.append(tracing.create_trace_config())
+
+
+async def close():
+    """
+    Close the search client session.
+    """
+    global _session
+
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def acquire():
+    """
+    Count a user of the search client, e.g. a bot. Pair it with `release()`.
+    """
+    global _users
+    _users += 1
+
+
+async def release():
+    """
+    Uncount a user of the search client, and close it when no user is left.
+    """
+    global _users
+    _users = max(_users - 1, 0)
+    if _users == 0:
+        await close()
+
 
 class SearchLang(Enum):
     CHINESE = "cht"
@@ -44,6 +129,7 @@ class SearchOption(NamedTuple):
     )  # ROC era
     timeout: ClientTimeout = ClientTimeout(total=2)
     delay: float = 1
+    url: str = COURSE_SEARCH_URL
 
     def as_dict(self):
         return {
@@ -64,74 +150,211 @@ class CourseData:
         self.quota: int = kwargs.get("quota")
         self.selected: int = kwargs.get("selected")
         self.url: str = kwargs.get("url")
+        self.slots: int = kwargs.get("slots")  # timetable bitmap
 
     @staticmethod
     def search(search_option: SearchOption, course_id: str):
         return get_course_data(search_option, course_id)
 
 
-async def get_course_data(search_option: SearchOption, course_id: str):
+@lru_cache(maxsize=None)
+def _code_query(search_option: SearchOption, course_id: str):
+    return json.dumps(
+        {
+            "baseOptions": search_option.as_dict(),
+            "typeOptions": {"code": {"enabled": True, "value": course_id}},
+        }
+    ).encode()
+
+
+# (search_option, course_id) -> static fields of the course
+_static_fields: Dict[Tuple[SearchOption, str], dict] = {}
+# (search_option, course_id) -> (raw body, quota, selected) of the last poll
+_last_polls: Dict[Tuple[SearchOption, str], Tuple[bytes, int, int]] = {}
+
+
+def _get_static_fields(search_option: SearchOption, data: dict):
+    t = data["scr_period"].rfind(" ")
+
+    return {
+        "name": data["sub_name"],
+        "credit": data["scr_credit"],
+        "is_elective": data["scj_scr_mso"] == "必修",
+        "period": data["scr_period"][:t],
+        "teacher": data["scr_period"][t + 1 :],
+        "url": f"https://coursesearch01.fcu.edu.tw/CourseOutline.aspx?lang={search_option.lang}&courseid={search_option.year}{search_option.sms.value}{data['cls_id']}{data['sub_id']}{data['scr_dup']}",
+        "slots": timetable.from_period(data["scr_period"]),
+    }
+
+
+@metrics.timed("course_data")
+@tracing.operation("quota")
+async def poll_quota(
+    search_option: SearchOption, course_id: str, table: "QuotaTable" = None
+):
     """
-    Get course data from coursesearch API.
+    Poll the quota of a course from coursesearch API, without building CourseData.
+    If the response is the same as the last one of the course, it is not decoded.
 
     Args:
         search_option (SearchOption): Search option.
         course_id (str): Course ID.
+        table (QuotaTable, optional): Quota table to update in place, on every poll. Defaults to None.
+
+    Raises:
+        CourseNotFound: No such course.
 
     Returns:
-        CourseData: Course data.
-        bool: True if course is not full, False otherwise.
+        int: Quota.
+        int: Selected count.
     """
-    async with request(
-        "POST",
-        COURSE_SEARCH_URL,
-        json={
-            "baseOptions": search_option.as_dict(),
-            "typeOptions": {"code": {"enabled": True, "value": course_id}},
-        },
+    metrics.POLLS_TOTAL.inc()
+
+    shadow.mark("poll_sent")
+    async with get_session().post(
+        search_option.url,
+        data=_code_query(search_option, course_id),
+        headers={"Content-Type": "application/json"},
         timeout=search_option.timeout,
     ) as res:
-        data = await res.json()
+        body = await res.read()
+    shadow.mark("response_received")
+
+    key = (search_option, course_id)
+    last = _last_polls.get(key)
+    unchanged = last is not None and last[0] == body
+    if unchanged:
+        metrics.CACHE_TOTAL.inc(cache="course_data", result="hit")
+        _, quota, selected = last
+
+    else:
+        metrics.CACHE_TOTAL.inc(cache="course_data", result="miss")
+
+        with profiling.phase("decode"):
+            data = loads(body)
         # data = json.loads(data["d"])
 
-    data = data.get("items", [])
+        data = data.get("items", [])
 
-    if len(data) == 0:
-        raise CourseNotFound(f"Course {course_id} not found.")
+        if len(data) == 0:
+            raise CourseNotFound(f"Course {course_id} not found.")
 
-    data = data[0]
+        data = data[0]
 
-    t = data["scr_period"].rfind(" ")
+        if key not in _static_fields:
+            with profiling.phase("decode"):
+                _static_fields[key] = _get_static_fields(search_option, data)
+
+        quota, selected = data["scr_precnt"], data["scr_acptcnt"]
+        _last_polls[key] = body, quota, selected
+        logger.debug("%s %s %d / %d", course_id, _static_fields[key]["name"], selected, quota)
+
+    events.emit(events.Poll(course_id, quota, selected, unchanged))
 
-    url = f"https://coursesearch01.fcu.edu.tw/CourseOutline.aspx?lang={search_option.lang}&courseid={search_option.year}{search_option.sms.value}{data['cls_id']}{data['sub_id']}{data['scr_dup']}"
+    # every table gets the row, the response cache is shared by the process
+    if table is not None:
+        table.update(course_id, quota, selected)
 
-    course = CourseData(
+    shadow.mark("decoded")
+    return quota, selected
+
+
+def course_data(search_option: SearchOption, course_id: str, quota: int, selected: int):
+    """
+    Build CourseData of a course polled with `poll_quota`, e.g. for a notification.
+
+    Args:
+        search_option (SearchOption): Search option.
+        course_id (str): Course ID.
+        quota (int): Quota.
+        selected (int): Selected count.
+
+    Returns:
+        CourseData: Course data.
+    """
+    return CourseData(
         course_id,
-        name=data["sub_name"],
-        credit=data["scr_credit"],
-        is_elective=data["scj_scr_mso"] == "必修",
-        period=data["scr_period"][:t],
-        teacher=data["scr_period"][t + 1 :],
-        quota=data["scr_precnt"],
-        selected=data["scr_acptcnt"],
-        url=url,
+        quota=quota,
+        selected=selected,
+        **_static_fields[(search_option, course_id)],
     )
 
-    logger.debug(f"{course.id} {course.name} {course.selected} / {course.quota}")
 
-    return course, course.selected < course.quota
+def course_slots(search_option: SearchOption, course_id: str):
+    """
+    Args:
+        search_option (SearchOption): Search option.
+        course_id (str): Course ID, polled with `poll_quota`.
+
+    Returns:
+        int: Timetable bitmap of the course.
+    """
+    return _static_fields[(search_option, course_id)]["slots"]
+
+
+async def get_course_data(
+    search_option: SearchOption, course_id: str, table: "QuotaTable" = None
+):
+    """
+    Get course data from coursesearch API. Poll loops use `poll_quota` instead.
+
+    Args:
+        search_option (SearchOption): Search option.
+        course_id (str): Course ID.
+        table (QuotaTable, optional): Quota table to update in place. Defaults to None.
+
+    Returns:
+        CourseData: Course data.
+        bool: True if course is not full, False otherwise.
+    """
+    quota, selected = await poll_quota(search_option, course_id, table)
+    return course_data(search_option, course_id, quota, selected), selected < quota
+
+
+@metrics.timed("search")
+@tracing.operation("quota")
+async def search_courses(
+    search_option: SearchOption, type_options: dict, table: "QuotaTable" = None
+):
+    """
+    Query coursesearch API with any type options, e.g. a whole department, for watching many courses with one request.
+
+    Args:
+        search_option (SearchOption): Search option.
+        type_options (dict): typeOptions of GetType2Result.
+        table (QuotaTable, optional): Quota table to update with every returned course. Defaults to None.
+
+    Returns:
+        List[dict]: Raw items.
+    """
+    metrics.POLLS_TOTAL.inc()
+
+    async with get_session().post(
+        search_option.url,
+        json={"baseOptions": search_option.as_dict(), "typeOptions": type_options},
+        timeout=search_option.timeout,
+    ) as res:
+        body = await res.read()
+
+    with profiling.phase("decode"):
+        items = loads(body).get("items", [])
+        if table is not None:
+            table.ingest(items)
+
+    return items
 
 
 @async_lru_cache(maxsize=None)  # Cache course id mapping
+@metrics.timed("course_id")
+@tracing.operation("course_id")
 async def get_course_id(
     search_option: SearchOption,
     course_name: str,
     course_weekday: str,
     course_period: str,
 ):
-    async with request(
-        "POST",
-        COURSE_SEARCH_URL,
+    async with get_session().post(
+        search_option.url,
         json={
             "baseOptions": search_option.as_dict(),
             "typeOptions": {
@@ -145,7 +368,7 @@ async def get_course_id(
         },
         timeout=search_option.timeout,
     ) as res:
-        data = await res.json()
+        data = loads(await res.read())
         # data = json.loads(data["d"])
 
     data = data.get("items", [])
@@ -153,6 +376,9 @@ async def get_course_id(
     if len(data) == 0:
         raise CourseNotFound(f"Course {course_name} not found.")
 
-    logger.debug(f"Course {course_name} found: {data[0]['scr_selcode']}")
+    logger.debug("Course %s found: %s", course_name, data[0]["scr_selcode"])
 
     return data[0]["scr_selcode"]
+
+
+metrics.register_lru_cache("course_id", get_course_id)
@@ -0,0 +1,166 @@
+"""
+Shadow (dry-run) mode: the bot logs in, polls and builds the final add
+postback as usual, but never sends it. Each poll that finds a free seat
+records a timeline of perf_counter marks, so the time between a seat opening
+and the select request can be broken down by stage:
+
+    poll_sent          the coursesearch request is about to be made
+    response_received  the response body is read
+    decoded            the course data is decoded, or taken from the last poll
+    decision           the bot decided to select
+    payload_built      the form body of the final add postback is encoded
+    request_sent       the body would be handed to aiohttp
+
+Run it against the stand-in (see benchmarks/shadow.py):
+
+    bot = FcuCourseMaster(..., shadow=True, **standin.bot_options(delay=0))
+    ...
+    print(bot.shadow.format_report())
+"""
+
+from collections import deque
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Deque, Dict, Iterable, List, Optional
+
+from . import metrics
+
+STAGES = (
+    "poll_sent",
+    "response_received",
+    "decoded",
+    "decision",
+    "payload_built",
+    "request_sent",
+)
+
+STAGE_SECONDS = metrics.registry.histogram(
+    "fcu_shadow_stage_seconds",
+    "Time from the previous stage of a shadow select timeline.",
+    ["stage"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class Timeline:
+    __slots__ = ("recorder", "course_id", "marks")
+
+    def __init__(self, recorder: "Recorder", course_id: str):
+        self.recorder = recorder
+        self.course_id = course_id
+        self.marks: Dict[str, float] = {}
+
+
+_timeline: ContextVar[Optional[Timeline]] = ContextVar("shadow_timeline", default=None)
+
+
+class Recorder:
+    def __init__(self, keep: int = 100000):
+        """
+        Collect finished shadow timelines. Can be shared between bots.
+
+        Args:
+            keep (int, optional): Timelines to keep, oldest are dropped. Defaults to 100000.
+        """
+        self.timelines: Deque[Dict[str, float]] = deque(maxlen=keep)
+
+    def add(self, timeline: Timeline):
+        self.timelines.append(timeline.marks)
+
+        previous = timeline.marks[STAGES[0]]
+        for stage in STAGES[1:]:
+            STAGE_SECONDS.observe(timeline.marks[stage] - previous, stage=stage)
+            previous = timeline.marks[stage]
+
+    def report(self, percentiles: Iterable[float] = (50, 90, 99, 100)):
+        """
+        Args:
+            percentiles (Iterable[float], optional): Percentiles, 0 to 100. Defaults to (50, 90, 99, 100).
+
+        Returns:
+            Dict[str, List[float]]: Seconds at each percentile for every stage, measured from the
+                previous stage, plus "total" (poll_sent to request_sent) and "open_to_request"
+                (response_received to request_sent).
+        """
+        spans = {stage: [] for stage in STAGES[1:]}
+        spans["total"] = []
+        spans["open_to_request"] = []
+
+        for marks in self.timelines:
+            for previous, stage in zip(STAGES, STAGES[1:]):
+                spans[stage].append(marks[stage] - marks[previous])
+            spans["total"].append(marks["request_sent"] - marks["poll_sent"])
+            spans["open_to_request"].append(marks["request_sent"] - marks["response_received"])
+
+        percentiles = list(percentiles)
+        report = {}
+        for name, values in spans.items():
+            values.sort()
+            report[name] = [
+                values[min(int(len(values) * p / 100), len(values) - 1)] if values else 0.0
+                for p in percentiles
+            ]
+        return report
+
+    def format_report(self, percentiles: Iterable[float] = (50, 90, 99, 100)):
+        """
+        Returns:
+            str: `report()` as a table in milliseconds.
+        """
+        percentiles = list(percentiles)
+        lines = [
+            f"{len(self.timelines)} timelines",
+            f"{'stage':<18}" + "".join(f"{f'p{p:g}':>10}" for p in percentiles),
+        ]
+        for name, values in self.report(percentiles).items():
+            lines.append(f"{name:<18}" + "".join(f"{v * 1000:8.3f}ms" for v in values))
+        return "\n".join(lines)
+
+    @staticmethod
+    def merge(recorders: List["Recorder"]):
+        """
+        Returns:
+            Recorder: A recorder with the timelines of every recorder.
+        """
+        merged = Recorder(sum(len(r.timelines) for r in recorders) or 1)
+        for recorder in recorders:
+            merged.timelines.extend(recorder.timelines)
+        return merged
+
+
+def begin(recorder: Recorder, course_id: str):
+    """
+    Start a timeline in the current context, replacing an unfinished one.
+
+    Args:
+        recorder (Recorder): Recorder to add the timeline to when it finishes.
+        course_id (str): Course ID being polled.
+    """
+    _timeline.set(Timeline(recorder, course_id))
+
+
+def mark(stage: str):
+    """
+    Mark a stage of the current timeline, a no-op outside shadow mode.
+    A later mark of the same stage, e.g. by the final postback after an arming one, wins.
+
+    Args:
+        stage (str): One of `STAGES`.
+    """
+    timeline = _timeline.get()
+    if timeline is not None:
+        timeline.marks[stage] = perf_counter()
+
+
+def finish():
+    """
+    Mark request_sent and hand the current timeline to its recorder.
+    """
+    timeline = _timeline.get()
+    if timeline is None:
+        return
+
+    timeline.marks["request_sent"] = perf_counter()
+    _timeline.set(None)
+    if all(stage in timeline.marks for stage in STAGES):
+        timeline.recorder.add(timeline)
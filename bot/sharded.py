@@ -0,0 +1,405 @@
+"""
+Multi-process runner for many accounts.
+
+The coordinator (the calling process) polls every target course once, however
+many accounts want it, and pushes an event to the workers whose accounts want
+a course whenever it has a free seat. Each worker process runs a share of the
+accounts on its own event loop, so logging in, parsing and selecting spread
+across cores without duplicating coursesearch traffic. Workers report back
+what they selected or dropped, and the coordinator stops polling a course
+once no account wants it.
+
+Messages are small tuples sent over `multiprocessing.Pipe`:
+
+    coordinator -> worker   ("open", CourseData)
+                            ("stop",)
+    worker -> coordinator   ("targets", username, [course_id, ...])
+                            ("selected", username, course_id)
+                            ("dropped", username, course_id, reason)
+                            ("done", username)
+
+See sharded.py for an example.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from multiprocessing.connection import Connection
+from typing import Dict, List, Set
+
+from . import FcuCourseMaster, TargetCourse, search
+from .error import CourseNotFound, CourseNotSelectabled, CreditNotEnough
+from .form_data import BASIC_STATE
+from .polling import FixedDelay, PollingStrategy
+from .resources import Resources
+from .search import CourseData, SearchOption
+
+
+class _Worker:
+    def __init__(self, conn: Connection, bots: List[FcuCourseMaster]):
+        self.logger = logging.getLogger(f"Worker-{os.getpid()}")
+        self.conn = conn
+        self.bots = bots
+        self.opened: "OrderedDict[str, CourseData]" = OrderedDict()
+        self.wakeup = asyncio.Event()
+        self.stopped = False
+
+    def send(self, *message):
+        self.conn.send(message)
+
+    async def receive(self):
+        while not self.stopped:
+            try:
+                # poll with a timeout, so the thread ends soon after the worker does
+                if not await asyncio.to_thread(self.conn.poll, 1):
+                    continue
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                message = ("stop",)
+
+            if message[0] == "open":
+                # coalesce, only the latest quota of a course matters
+                course_data: CourseData = message[1]
+                self.opened.pop(course_data.id, None)
+                self.opened[course_data.id] = course_data
+
+            elif message[0] == "stop":
+                self.stopped = True
+
+            self.wakeup.set()
+
+    async def prepare(self, bot: FcuCourseMaster):
+        while True:
+            try:
+                await bot.prepare()
+                break
+
+            except Exception as e:
+                bot.logger.exception(e)
+                bot.cached_verify_code = None
+                if getattr(e, "should_exit", False):
+                    bot.planner.clear()
+                    break
+
+                await asyncio.sleep(5)
+
+        self.send("targets", bot.account.username, [c.course_id for c in bot.planner.feasible()])
+
+    def drop(self, bot: FcuCourseMaster, course: TargetCourse, reason: str):
+        bot.logger.warning("%s dropped: %s", course.course_id, reason)
+        bot.planner.remove(course.course_id)
+        self.send("dropped", bot.account.username, course.course_id, reason)
+
+    async def select(self, bot: FcuCourseMaster, course: TargetCourse, course_data: CourseData):
+        e = bot.planner.learn_slots(course, course_data.slots)
+        if e:
+            self.drop(bot, course, str(e))
+            return
+
+        try:
+            selected = await bot.select_course(course.course_id)
+
+        except (CreditNotEnough, CourseNotFound, CourseNotSelectabled) as e:
+            self.drop(bot, course, str(e))
+            return
+
+        if selected:
+            bot.logger.info("%s selected.", course.course_id)
+            bot.planner.remove(course.course_id)
+            self.send("selected", bot.account.username, course.course_id)
+            await bot.notification.select_successful(
+                course_data, bot.max_credit, bot.current_credit
+            )
+
+    async def tick(self):
+        for bot in self.bots:
+            if not bot.planner.feasible():
+                continue
+
+            try:
+                if datetime.now() - bot.heartbeat > timedelta(minutes=8):
+                    bot.logger.info("Keep session alive...")
+                    await bot.postback({**BASIC_STATE})
+                await bot.rearm()
+
+            except Exception as e:
+                bot.logger.exception(e)
+                await self.prepare(bot)
+
+        while self.opened:
+            _, course_data = self.opened.popitem(last=False)
+
+            for bot in self.bots:
+                course = bot.planner.get(course_data.id)
+                if course is None:
+                    continue
+
+                # blocked since a selection, e.g. by credit, stop the coordinator polling it for us
+                if course.course_id in bot.planner.blocked:
+                    self.drop(bot, course, str(bot.planner.blocked[course.course_id]))
+                    continue
+
+                try:
+                    await self.select(bot, course, course_data)
+
+                except Exception as e:
+                    bot.logger.exception(e)
+                    await self.prepare(bot)
+
+    async def run(self):
+        receiver = asyncio.create_task(self.receive())
+
+        for bot in self.bots:
+            await self.prepare(bot)
+
+        while not self.stopped and any(bot.planner.feasible() for bot in self.bots):
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), 30)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            await self.tick()
+
+        self.stopped = True
+        for bot in self.bots:
+            self.send("done", bot.account.username)
+            await bot.close()
+        await receiver
+
+
+def _worker_main(conn: Connection, accounts: List[dict], log_level: int):
+    logging.basicConfig(
+        level=log_level,
+        format="[%(levelname)s][%(asctime)s][%(name)s]%(message)s",
+        datefmt="%Y/%m/%d %H:%M:%S",
+    )
+
+    async def main():
+        # one pool and DNS cache for the accounts of this worker
+        async with Resources() as resources:
+            bots = [FcuCourseMaster(**account, resources=resources) for account in accounts]
+            await _Worker(conn, bots).run()
+
+    asyncio.run(main())
+    conn.close()
+
+
+class ShardedRunner:
+    def __init__(
+        self,
+        accounts: List[dict],
+        processes: int = None,
+        search_option: SearchOption = SearchOption(),
+        polling: PollingStrategy = None,
+        quota_log: str = None,
+    ):
+        """
+        Run accounts in worker processes, polling every target course once in this process.
+
+        Args:
+            accounts (List[dict]): Keyword arguments of `FcuCourseMaster` for each account, must be picklable.
+            processes (int, optional): Number of worker processes. Defaults to the number of CPUs.
+            search_option (SearchOption, optional): Search option of the coordinator and the accounts. Defaults to SearchOption().
+            polling (PollingStrategy, optional): Polling strategy. Defaults to FixedDelay(search_option.delay).
+            quota_log (str, optional): Path of a quota history log, see `bot.history`. Defaults to None.
+        """
+        self.logger = logging.getLogger("ShardedRunner")
+        self.accounts = [{"search_option": search_option, **account} for account in accounts]
+        self.processes = min(processes or os.cpu_count() or 1, len(accounts))
+        self.search_option = search_option
+        self.polling = polling or FixedDelay(search_option.delay)
+
+        from .history import QuotaLog
+        from .quota import QuotaTable
+
+        self.quota_table = QuotaTable()
+        self.quota_log = QuotaLog.shared(quota_log) if quota_log else None
+
+        # course_id -> usernames that still want it, in polling order
+        self.wanted: Dict[str, Set[str]] = {}
+        for account in self.accounts:
+            for course in account["target_courses"]:
+                self.wanted.setdefault(course.course_id, set()).add(account["username"])
+
+        self.shard_of: Dict[str, int] = {}
+        self.conns: List[Connection] = []
+        self.workers: List[multiprocessing.Process] = []
+        self.selected: Dict[str, List[str]] = {}
+        self.done: Set[str] = set()
+
+    def forget(self, username: str, course_id: str):
+        usernames = self.wanted.get(course_id)
+        if usernames is not None:
+            usernames.discard(username)
+            if not usernames:
+                del self.wanted[course_id]
+
+    def handle(self, message: tuple):
+        kind, username, *args = message
+
+        if kind == "targets":
+            for course_id in list(self.wanted):
+                if course_id not in args[0]:
+                    self.forget(username, course_id)
+
+        elif kind == "selected":
+            self.logger.info("%s selected %s.", username, args[0])
+            self.selected.setdefault(username, []).append(args[0])
+            self.forget(username, args[0])
+
+        elif kind == "dropped":
+            self.logger.info("%s dropped %s: %s", username, args[0], args[1])
+            self.forget(username, args[0])
+
+        elif kind == "done":
+            self.done.add(username)
+            for course_id in list(self.wanted):
+                self.forget(username, course_id)
+
+    def lost(self, shard: int):
+        """
+        Forget the accounts of a worker that ended without reporting them done, e.g. crashed.
+
+        Args:
+            shard (int): Index of the worker.
+        """
+        usernames = [u for u, i in self.shard_of.items() if i == shard and u not in self.done]
+        if not usernames:
+            return
+
+        self.logger.error(
+            "Worker %d ended (exit code %s) before %d accounts were done.",
+            shard,
+            self.workers[shard].exitcode,
+            len(usernames),
+        )
+        for username in usernames:
+            self.handle(("done", username))
+
+    async def receive(self, shard: int):
+        conn = self.conns[shard]
+        # runs until the worker ends and its end of the pipe is closed
+        while True:
+            try:
+                if not await asyncio.to_thread(conn.poll, 1):
+                    continue
+                message = conn.recv()
+            except (EOFError, OSError):
+                # reap the worker first, so a crash is logged with its exit code
+                await asyncio.to_thread(self.workers[shard].join, 5)
+                self.lost(shard)
+                return
+            self.handle(message)
+
+    def start_workers(self):
+        context = multiprocessing.get_context("spawn")
+
+        for i in range(self.processes):
+            shard = self.accounts[i :: self.processes]
+            for account in shard:
+                self.shard_of[account["username"]] = i
+
+            conn, child_conn = context.Pipe()
+            worker = context.Process(
+                target=_worker_main,
+                args=(child_conn, shard, logging.getLogger().getEffectiveLevel()),
+                name=f"shard-{i}",
+                daemon=True,
+            )
+            worker.start()
+            child_conn.close()
+
+            self.conns.append(conn)
+            self.workers.append(worker)
+
+        self.logger.info(
+            "Started %d workers for %d accounts.", len(self.workers), len(self.accounts)
+        )
+
+    def publish(self, course_data: CourseData):
+        shards = {self.shard_of[username] for username in self.wanted.get(course_data.id, ())}
+        for i in shards:
+            try:
+                self.conns[i].send(("open", course_data))
+            except OSError:
+                pass
+
+    async def start(self):
+        """
+        Start the workers and poll until every account is done.
+
+        Returns:
+            Dict[str, List[str]]: Course IDs selected by each account.
+        """
+        self.start_workers()
+        receivers = [asyncio.create_task(self.receive(i)) for i in range(len(self.conns))]
+
+        try:
+            while self.wanted and any(worker.is_alive() for worker in self.workers):
+                if self.polling.batch is not None:
+                    try:
+                        items = await search.search_courses(
+                            self.search_option, self.polling.batch, self.quota_table
+                        )
+                        self.polling.observe_batch(
+                            [item["scr_selcode"] for item in items], time.time()
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+
+                due = self.polling.due(list(self.wanted), self.quota_table, time.time())
+
+                for course_id in due:
+                    if course_id not in self.wanted:
+                        continue
+
+                    try:
+                        quota, selected = await search.poll_quota(
+                            self.search_option, course_id, self.quota_table
+                        )
+                    except CourseNotFound:
+                        self.logger.warning("%s not found.", course_id)
+                        del self.wanted[course_id]
+                        continue
+                    except asyncio.TimeoutError:
+                        continue
+
+                    self.polling.observe(course_id, quota, selected, time.time())
+                    if self.quota_log:
+                        self.quota_log.write(course_id, quota, selected)
+
+                    if selected < quota:
+                        self.publish(
+                            search.course_data(self.search_option, course_id, quota, selected)
+                        )
+
+                await asyncio.sleep(self.polling.delay(time.time()))
+
+        finally:
+            for conn in self.conns:
+                try:
+                    conn.send(("stop",))
+                except OSError:
+                    pass
+
+            for worker in self.workers:
+                await asyncio.to_thread(worker.join, 30)
+                if worker.is_alive():
+                    worker.terminate()
+                    await asyncio.to_thread(worker.join)
+
+            # every worker has ended, so each receiver sees EOF before its conn is closed
+            await asyncio.gather(*receivers)
+            for conn in self.conns:
+                conn.close()
+
+            await search.close()
+            if self.quota_log:
+                self.quota_log.close()
+
+        return self.selected
@@ -0,0 +1,74 @@
+import re
+from typing import Iterable, Tuple
+
+# A timetable is an int bitmap, bit (week - 1) * PERIODS + period is set if the slot is occupied.
+WEEKS = 7
+PERIODS = 15  # period 0 to 14
+WEEKDAYS = "一二三四五六日"
+
+_PERIOD_PATTERN = re.compile(r"\(([一二三四五六日])\)(\d{1,2})(?:-(\d{1,2}))?")
+
+
+def slot(week: int, period: int):
+    """
+    Args:
+        week (int): 1 (Monday) to 7 (Sunday).
+        period (int): 0 to 14.
+
+    Returns:
+        int: Bitmap of a single slot.
+    """
+    return 1 << ((week - 1) * PERIODS + period)
+
+
+def from_cells(cells: Iterable[Tuple[str, int, int]]):
+    """
+    Build a bitmap from timetable cells, see `parser.ParsedPage.timetable`.
+
+    Args:
+        cells (Iterable[Tuple[str, int, int]]): (course_name, week, period) of each occupied cell.
+
+    Returns:
+        int: Bitmap.
+    """
+    bitmap = 0
+    for _, week, period in cells:
+        bitmap |= slot(week, period)
+    return bitmap
+
+
+def from_period(period: str):
+    """
+    Build a bitmap from a coursesearch period string, e.g. "(一)03-04 資電234 (三)02".
+
+    Args:
+        period (str): Period string.
+
+    Returns:
+        int: Bitmap.
+    """
+    bitmap = 0
+    for week, start, end in _PERIOD_PATTERN.findall(period or ""):
+        week = WEEKDAYS.index(week) + 1
+        for p in range(int(start), int(end or start) + 1):
+            bitmap |= slot(week, p)
+    return bitmap
+
+
+def conflicts(a: int, b: int):
+    return a & b != 0
+
+
+def format_slots(bitmap: int):
+    """
+    Args:
+        bitmap (int): Bitmap.
+
+    Returns:
+        str: Human readable slots, e.g. "(一)03 (一)04".
+    """
+    return " ".join(
+        f"({WEEKDAYS[i // PERIODS]}){i % PERIODS:02d}"
+        for i in range(WEEKS * PERIODS)
+        if bitmap >> i & 1
+    )
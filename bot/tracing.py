@@ -0,0 +1,174 @@
+import functools
+import logging
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, List
+
+from aiohttp import TraceConfig
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_operation: ContextVar[str] = ContextVar("operation", default="other")
+
+PHASE_SECONDS = metrics.registry.histogram(
+    "fcu_http_phase_seconds",
+    "Per-request phase timings (queued, dns, connect, ttfb, body, total).",
+    ["operation", "phase"],
+)
+CONNECTIONS_TOTAL = metrics.registry.counter(
+    "fcu_http_connections_total",
+    "Requests by connection kind (reused or new).",
+    ["operation", "kind"],
+)
+
+sinks: List[Callable[[dict], None]] = []
+
+
+class operation:
+    def __init__(self, name: str):
+        """
+        Tag requests made inside with a logical operation.
+        Works as a context manager or as a decorator of an async function.
+
+        Args:
+            name (str): Operation name, e.g. "login", "keepalive", "select", "quota", "course_id".
+        """
+        self.name = name
+        self.tokens = []
+
+    def __enter__(self):
+        self.tokens.append(_operation.set(self.name))
+        return self
+
+    def __exit__(self, *exc):
+        _operation.reset(self.tokens.pop())
+
+    def __call__(self, async_function):
+        @functools.wraps(async_function)
+        async def wrapper(*args, **kwargs):
+            token = _operation.set(self.name)
+            try:
+                return await async_function(*args, **kwargs)
+            finally:
+                _operation.reset(token)
+
+        return wrapper
+
+
+def current_operation():
+    return _operation.get()
+
+
+def emit(record: dict):
+    """
+    Send a finished request record to metrics, the log and every sink.
+
+    Args:
+        record (dict): Request record.
+    """
+    op = record["operation"]
+    for phase in ("queued", "dns", "connect", "ttfb", "body", "total"):
+        if record.get(phase) is not None:
+            PHASE_SECONDS.observe(record[phase], operation=op, phase=phase)
+    CONNECTIONS_TOTAL.inc(operation=op, kind="reused" if record["reused"] else "new")
+
+    logger.debug("[Trace] %s", record, extra={"trace": record})
+
+    for sink in sinks:
+        sink(record)
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.start = perf_counter()
+    ctx.marks = {}
+    ctx.emitted = False
+    ctx.record = {
+        "operation": current_operation(),
+        "method": params.method,
+        "url": f"{params.url.host}{params.url.path}",
+        "status": None,
+        "reused": False,
+        "queued": None,
+        "dns": None,
+        "connect": None,
+        "ttfb": None,
+        "body": None,
+        "total": None,
+        "error": None,
+    }
+
+
+def _mark(name):
+    async def on_mark(session, ctx, params):
+        ctx.marks[name] = perf_counter()
+
+    return on_mark
+
+
+def _phase(phase, start_mark):
+    async def on_phase_end(session, ctx, params):
+        ctx.record[phase] = perf_counter() - ctx.marks.get(start_mark, ctx.start)
+
+    return on_phase_end
+
+
+async def _on_connection_reuseconn(session, ctx, params):
+    ctx.record["reused"] = True
+
+
+async def _on_request_headers_sent(session, ctx, params):
+    ctx.marks["sent"] = perf_counter()
+
+
+async def _on_request_end(session, ctx, params):
+    now = perf_counter()
+    ctx.marks["headers"] = now
+    ctx.record["status"] = params.response.status
+    ctx.record["ttfb"] = now - ctx.marks.get("sent", ctx.start)
+
+
+async def _on_response_chunk_received(session, ctx, params):
+    # aiohttp sends it once, after the whole body has been read.
+    if ctx.emitted:
+        return
+
+    now = perf_counter()
+    ctx.record["body"] = now - ctx.marks.get("headers", now)
+    ctx.record["total"] = now - ctx.start
+    ctx.emitted = True
+    emit(ctx.record)
+
+
+async def _on_request_exception(session, ctx, params):
+    if ctx.emitted:
+        return
+
+    ctx.record["error"] = type(params.exception).__name__
+    ctx.record["total"] = perf_counter() - ctx.start
+    ctx.emitted = True
+    emit(ctx.record)
+
+
+def create_trace_config():
+    """
+    Create a TraceConfig recording phase timings of every request.
+
+    Returns:
+        TraceConfig: Trace config for ClientSession(trace_configs=[...]).
+    """
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_connection_queued_start.append(_mark("queued"))
+    trace_config.on_connection_queued_end.append(_phase("queued", "queued"))
+    trace_config.on_dns_resolvehost_start.append(_mark("dns"))
+    trace_config.on_dns_resolvehost_end.append(_phase("dns", "dns"))
+    trace_config.on_connection_create_start.append(_mark("connect"))
+    trace_config.on_connection_create_end.append(_phase("connect", "connect"))
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_request_headers_sent.append(_on_request_headers_sent)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_response_chunk_received.append(_on_response_chunk_received)
+    trace_config.on_request_exception.append(_on_request_exception)
+    return trace_config
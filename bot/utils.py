@@ -1,13 +1,15 @@
 import asyncio
 from datetime import datetime, timedelta
 from logging import getLogger
-
-from bs4 import BeautifulSoup
+from typing import TYPE_CHECKING
 
 from .error import *
 
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
 
-def check_response(soup: BeautifulSoup):
+def check_response(soup: "BeautifulSoup"):
     """
     Check if response is valid.
 
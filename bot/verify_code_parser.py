@@ -1,6 +1,3 @@
-import cv2
-import numpy as np
-
 # fmt: off
 DIGITS =  [
   [
@@ -68,6 +65,10 @@ def parse_veify_code(image: bytes):
     Returns:
         str: Verify code.
     """
+    # cv2 is slow to import and only needed once per login
+    import cv2
+    import numpy as np
+
     code = ""
     image = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
     for i in range(4):  # 4 digits
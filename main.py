@@ -1,6 +1,5 @@
 import logging
-import asyncio
-from bot import FcuCourseMaster, TargetCourse
+from bot import FcuCourseMaster, TargetCourse, loop
 
 # Set up logging
 logging.basicConfig(
@@ -10,14 +9,18 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()],
 )
 
-# Create bot instance
-bot = FcuCourseMaster(
-    username="D1234567",
-    password="password",
-    target_courses=[
-        TargetCourse("1234", 2, True),
-    ],
-)
 
-# Run the bot
-asyncio.get_event_loop().run_until_complete(bot.start())
\ No newline at end of file
+async def main():
+    # Create bot instance inside the loop, so its session belongs to it
+    async with FcuCourseMaster(
+        username="D1234567",
+        password="password",
+        target_courses=[
+            TargetCourse("1234", 2, True),
+        ],
+    ) as bot:
+        await bot.start()
+
+
+# Run the bot, on uvloop if installed, with a loop lag monitor
+loop.run(main())
@@ -1,6 +1,12 @@
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Callable, Deque, Dict, List
 from bot import *
+from bot import loop
+from bot.history import QuotaLog
+from bot.quota import QuotaTable
+from bot.resources import Resources
 from bot.search import SearchOption
 from bot.utils import wait_until_service_time
 from base64 import b64decode
@@ -14,22 +20,6 @@ logging.basicConfig(
 
 service_time = datetime(2023, 2, 10, 13, 0, 0)  # service time
 
-bots = [
-    FcuCourseMaster(
-        username="D1234567",
-        password="password",
-        target_courses=[],  # keep it empty when using multi_account.py
-        debug=True,
-        search_option=SearchOption(delay=1),  # will use first bot's search_option
-    ),
-    FcuCourseMaster(
-        username="D7654321",
-        password="password",
-        target_courses=[],  # keep it empty when using multi_account.py
-        debug=True,
-    ),
-]
-
 target_courses = {
     TargetCourse("1234", 2, True): [0],  # course_id, credit, use_wishlist, bot_indexes
     TargetCourse("5678", 2, True): [1],
@@ -38,22 +28,129 @@ target_courses = {
 
 
 class MutliAccountBot:
-    def __init__(self, bots: List[FcuCourseMaster], target_courses: Dict[TargetCourse, List[int]]):
+    def __init__(
+        self,
+        bots: List[FcuCourseMaster],
+        target_courses: Dict[TargetCourse, List[int]],
+        profile: str = None,
+        quota_log: str = None,
+    ):
         self.logger = logging.getLogger("MultiAccountBot")
         self.bots = bots
         self.target_courses = target_courses
 
+        # each bot plans its own share, by its own timetable and credit
+        for course, bot_indexes in self.target_courses.items():
+            for bot_index in bot_indexes:
+                self.bots[bot_index].planner.add(course)
+
         self.error_count = 0
+        self.quota_table = QuotaTable()
+        self.quota_log = QuotaLog.shared(quota_log) if quota_log else None
+
+        # share one profiler, so phases of every bot end up in the same profiles
+        self.profiler = profiling.create_profiler(profile)
+        if profile:
+            for bot in self.bots:
+                bot.profiler = self.profiler
+
+        # runtime control, see `bot.control`
+        self.paused = False
+        self.exit_when_done = True
+        self.pending_changes: Deque[Callable[[], None]] = deque()
+
+    def add_target(self, course: TargetCourse, bot_indexes: List[int], index: int = None):
+        if any(i not in range(len(self.bots)) for i in bot_indexes):
+            raise ValueError(f"Invalid bot indexes: {bot_indexes}")
+
+        def change():
+            items = [(c, i) for c, i in self.target_courses.items() if c.course_id != course.course_id]
+            items.insert(len(items) if index is None else index, (course, list(bot_indexes)))
+            self.target_courses = dict(items)
+            for bot_index, bot in enumerate(self.bots):
+                bot.planner.remove(course.course_id)
+                if bot_index in bot_indexes:
+                    bot.planner.add(course)
+            self.logger.info("[Control] %s added for %s.", course.course_id, bot_indexes)
+
+        self.pending_changes.append(change)
+
+    def remove_target(self, course_id: str):
+        def change():
+            self.target_courses = {c: i for c, i in self.target_courses.items() if c.course_id != course_id}
+            for bot in self.bots:
+                bot.planner.remove(course_id)
+            self.logger.info("[Control] %s removed.", course_id)
+
+        self.pending_changes.append(change)
+
+    def reprioritize(self, course_id: str, index: int):
+        def change():
+            items = list(self.target_courses.items())
+            for i, (course, _) in enumerate(items):
+                if course.course_id == course_id:
+                    items.insert(index, items.pop(i))
+                    self.target_courses = dict(items)
+                    self.logger.info("[Control] %s moved to %d.", course_id, index)
+                    return
+
+        self.pending_changes.append(change)
+
+    def pause(self):
+        self.pending_changes.append(lambda: self._set_paused(True))
+
+    def resume(self):
+        self.pending_changes.append(lambda: self._set_paused(False))
+
+    def _set_paused(self, paused: bool):
+        self.paused = paused
+        events.emit(events.StateChange(self.logger.name, "paused", paused))
+
+    def apply_pending_changes(self):
+        while self.pending_changes:
+            change = self.pending_changes.popleft()
+            try:
+                change()
+            except Exception as e:
+                # a bad change must not end the tick, which would log in again
+                self.logger.exception("[Control] Change dropped: %s", e)
+
+    def wanted_by(self, course: TargetCourse):
+        """
+        Returns:
+            List[int]: Indexes of the bots that can still take the course.
+        """
+        return [i for i in self.target_courses.get(course, ()) if self.bots[i].planner.is_feasible(course.course_id)]
+
+    def feasible(self):
+        """
+        Returns:
+            List[TargetCourse]: Target courses that at least one bot can still take, in priority order.
+        """
+        return [course for course in self.target_courses if self.wanted_by(course)]
+
+    def snapshot(self):
+        return {
+            "paused": self.paused,
+            "target_courses": [
+                {**course.as_dict(), "bot_indexes": bot_indexes} for course, bot_indexes in self.target_courses.items()
+            ],
+            "quota": self.quota_table.as_dict(),
+            "bots": [bot.snapshot() for bot in self.bots],
+            "pending_changes": len(self.pending_changes),
+        }
 
     async def start(self):
         search_option = self.bots[0].search_option
+        polling = self.bots[0].polling
 
         while True:
             try:
-                for bot_index, bot in enumerate(self.bots):
+                for bot in self.bots:
                     while True:
                         try:
-                            await bot.login()
+                            # login, drop selected and unfit courses from its plan, fill the wishlist
+                            await bot.prepare()
                             break
 
                         except LoginFailed as e:
@@ -64,116 +161,122 @@ class MutliAccountBot:
 
                             await asyncio.sleep(1)
 
-                    # show current courses
-                    bot.logger.info(f"Credit: {bot.current_credit}/{bot.max_credit}")
-                    bot.logger.info("Selected courses:")
-                    bot.logger.info(
-                        ", ".join(
-                            [f"{course_id}({course_name})" for course_id, course_name in bot.selected_courses.items()]
-                        )
-                    )
-                    bot.logger.info("Wishlisted courses:")
-                    bot.logger.info(
-                        ", ".join(
-                            [f"{course_id}({course_name})" for course_id, course_name in bot.wishlisted_courses.items()]
-                        )
-                    )
-
-                    # add all target courses with use_wishlist to wishlist
-                    for course, bot_indexes in self.target_courses.items():
-                        if bot_index in bot_indexes:
-                            if course.course_id in bot.selected_courses:
-                                bot.logger.warning("%s already selected.", course.course_id)
-                                bot_indexes.remove(bot_index)
-                                continue
-
-                            if course.credit > bot.max_credit - bot.current_credit and course.strategy == Strategy.NEW:
-                                bot.logger.warning("%s credit exceeds limit.", course.course_id)
-                                bot_indexes.remove(bot_index)
-                                continue
-
-                            if course.use_wishlist and course.course_id not in bot.wishlisted_courses:
-                                try:
-                                    await bot.add_wishlist(course.course_id)
-
-                                except CourseNotFound:
-                                    self.logger.warning("%s not found.", course.course_id)
-                                    self.target_courses[course] = []
-
                 while True:
+                    self.apply_pending_changes()
+
                     now = datetime.now()
 
                     for bot in self.bots:
                         if now - bot.heartbeat > timedelta(minutes=8):
                             bot.logger.info("Keep session alive...")
-                            await bot.postback({**BASIC_STATE})
+                            with tracing.operation("keepalive"):
+                                await bot.postback({**BASIC_STATE})
+
+                    if self.paused:
+                        await asyncio.sleep(search_option.delay)
+                        continue
+
+                    for bot in self.bots:
+                        await bot.rearm([c for c in self.target_courses if bot.planner.is_feasible(c.course_id)])
+
+                    if polling.batch is not None:
+                        items = await search.search_courses(search_option, polling.batch, self.quota_table)
+                        polling.observe_batch([item["scr_selcode"] for item in items], time.time())
+
+                    targets = self.feasible()
+                    target_ids = [c.course_id for c in targets]
+                    due = set(polling.due(target_ids, self.quota_table, time.time()))
+                    # courses that just gained a free seat are tried first
+                    opened = set(self.quota_table.openings(target_ids))
 
                     should_remove = []
-                    for course, bot_indexes in self.target_courses.items():
+                    for course in sorted(targets, key=lambda c: c.course_id not in opened):
+                        if course.course_id not in due:
+                            continue
 
                         try:
-                            course_data, course_has_quota = await search.get_course_data(
-                                search_option, course.course_id
+                            quota, selected = await search.poll_quota(
+                                search_option, course.course_id, self.quota_table
                             )
 
-                            if not course_has_quota:
+                            polling.observe(course.course_id, quota, selected, time.time())
+                            if self.quota_log:
+                                self.quota_log.write(course.course_id, quota, selected)
+
+                            # reject clashes and credit overflow locally, per account
+                            slots = search.course_slots(search_option, course.course_id)
+                            for bot_index in self.wanted_by(course):
+                                e = self.bots[bot_index].planner.learn_slots(course, slots)
+                                if e:
+                                    self.bots[bot_index].logger.warning("%s skipped: %s", course.course_id, e)
+
+                            if selected >= quota:
                                 continue
 
-                            for bot_index in bot_indexes:
+                            quota_detected_at = time.perf_counter()
+                            # bots that took a course this tick may not fit this one anymore
+                            for bot_index in self.wanted_by(course):
                                 bot = self.bots[bot_index]
 
-                                if await bot.select_course(course.course_id):
+                                try:
+                                    success = await bot.select_course(course.course_id)
+
+                                except CourseNotSelectabled as e:
+                                    # not selectable for this account only, e.g. by its department
+                                    bot.logger.warning("%s not selectable.", course.course_id)
+                                    events.emit(events.Error.of(bot.account.username, e, course.course_id))
+                                    bot.planner.remove(course.course_id)
+                                    continue
+
+                                except CreditNotEnough:
+                                    bot.planner.remove(course.course_id)
+                                    continue
+
+                                if success:
+                                    metrics.QUOTA_TO_SELECT_SECONDS.observe(
+                                        time.perf_counter() - quota_detected_at
+                                    )
                                     await bot.notification.select_successful(
-                                        course_data,
+                                        search.course_data(search_option, course.course_id, quota, selected),
                                         bot.max_credit,
                                         bot.current_credit,
                                     )
                                     bot.logger.info("%s selected.", course.course_id)
-                                    bot_indexes.remove(bot_index)
-
-                                    # remove all courses that credit exceeds max credit
-                                    credits = bot.max_credit - bot.current_credit
-                                    for c, i in self.target_courses.items():
-                                        if bot_index in i and c.credit > credits:
-                                            bot.logger.info(
-                                                "%s removed because credit exceeds max credit.", c.course_id
-                                            )
-                                            i.remove(bot_index)
-
-                        except CourseNotFound:
-                            self.logger.warning("%s not found.", course.course_id)
-                            should_remove.append(course)
+                                    # courses that no longer fit were blocked by bot.replan() on the postback
+                                    bot.planner.remove(course.course_id)
 
-                        except CourseNotSelectabled:
-                            self.logger.warning("%s not selectable.", course.course_id)
+                        except CourseNotFound as e:
+                            self.logger.warning("%s not found.", course.course_id)
+                            events.emit(events.Error.of(self.logger.name, e, course.course_id))
                             should_remove.append(course)
 
-                        except CreditNotEnough:
-                            self.target_courses[course].remove(bot_index)
-
                         except asyncio.TimeoutError:
                             continue
 
                     for course in should_remove:
                         self.target_courses.pop(course)
+                        for bot in self.bots:
+                            bot.planner.remove(course.course_id)
 
-                    if len(self.target_courses) == 0:
+                    # blocked courses are still polled, a drop may make them fit again
+                    if not any(bot.planner for bot in self.bots) and self.exit_when_done:
                         self.logger.info("All target courses selected.")
                         break
 
-                    await asyncio.sleep(search_option.delay)
+                    await asyncio.sleep(polling.delay(time.time()))
 
                     self.error_count = 0
 
             except Exception as e:
                 self.logger.exception(e)
+                events.emit(events.Error.of(self.logger.name, e))
                 for bot in self.bots:
-                    self.cached_verify_code = None
+                    bot.cached_verify_code = None
 
                 if getattr(e, "should_exit", False):
                     break
 
-            if len(self.target_courses) == 0:
+            if not any(bot.planner for bot in self.bots) and self.exit_when_done:
                 break
 
             self.error_count += 1
@@ -186,15 +289,51 @@ class MutliAccountBot:
 
             await asyncio.sleep(5)
 
+        self.profiler.dump()
+        if self.quota_log:
+            self.quota_log.flush()
+
+    async def close(self):
+        for bot in self.bots:
+            await bot.close()
+        if self.quota_log:
+            self.quota_log.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
 
 async def main():
     while True:
         if await wait_until_service_time(service_time):
             break
 
-    mab = MutliAccountBot(bots, target_courses)
-
-    await mab.start()
-
-
-asyncio.get_event_loop().run_until_complete(main())
+    # bots are created inside the loop, so their sessions belong to it.
+    # They share one connection pool, each keeps its own cookies.
+    async with Resources() as resources:
+        bots = [
+            FcuCourseMaster(
+                username="D1234567",
+                password="password",
+                target_courses=[],  # keep it empty when using multi_account.py
+                debug=True,
+                search_option=SearchOption(delay=1),  # will use first bot's search_option and polling
+                resources=resources,
+            ),
+            FcuCourseMaster(
+                username="D7654321",
+                password="password",
+                target_courses=[],  # keep it empty when using multi_account.py
+                debug=True,
+                resources=resources,
+            ),
+        ]
+
+        async with MutliAccountBot(bots, target_courses) as mab:
+            await mab.start()
+
+
+loop.run(main())
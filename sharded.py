@@ -0,0 +1,32 @@
+import asyncio
+import logging
+
+from bot import TargetCourse
+from bot.search import SearchOption
+from bot.sharded import ShardedRunner
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(levelname)s][%(asctime)s][%(name)s]%(message)s",
+    datefmt="%Y/%m/%d %H:%M:%S",
+    handlers=[logging.StreamHandler()],
+)
+
+# Keyword arguments of FcuCourseMaster for each account
+accounts = [
+    {
+        "username": "D1234567",
+        "password": "password",
+        "target_courses": [TargetCourse("1234", 2), TargetCourse("0000", 2)],
+    },
+    {
+        "username": "D7654321",
+        "password": "password",
+        "target_courses": [TargetCourse("5678", 2), TargetCourse("0000", 2)],
+    },
+]
+
+# Worker processes are spawned, so the entry point must be guarded
+if __name__ == "__main__":
+    runner = ShardedRunner(accounts, processes=2, search_option=SearchOption(delay=1))
+    asyncio.run(runner.start())